@@ -0,0 +1,214 @@
+#
+# Copyright 2020 University of Toronto
+#
+# Permission is hereby granted, to use this software and associated
+# documentation files (the "Software") in course work at the University
+# of Toronto, or for personal use. Other uses are prohibited, in
+# particular the distribution of the Software either publicly or to third
+# parties.
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+import argparse
+import contextlib
+import csv
+import json
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+import types
+
+''' Throughput benchmark for the lab1 file transfer.
+
+Runs send_file and receive_file against each other in one process over LoopbackSocket, an in-memory stand-in for
+ece361.network.socket.Socket, and sweeps buffer_size, file size and transfer mode. Every run records the number of
+segments, the wall time, the CPU time of the process and the resulting bytes/s, and the results can be written to
+CSV and/or JSON so that versions can be compared:
+
+	python3 benchmark.py --buffer-sizes 100 1000 --file-sizes 100000 1000000 --csv results.csv --json results.json
+'''
+
+
+class LoopbackSocket:
+	''' Delivers messages through one in-memory queue per (address, port), with the same sendto/recvfrom interface
+	as the lab1 Socket. Like the lab1 Socket it only carries str messages.'''
+	queues = {}
+	lock = threading.Lock()
+
+	def __init__(self, student_id):
+		self.student_id = student_id
+		self.address = ('loopback', 'socket%d' % id(self))
+
+	@classmethod
+	def _queue(cls, address):
+		with cls.lock:
+			return cls.queues.setdefault(address, queue.Queue())
+
+	def change_source_address(self, address=None, port=None):
+		self.address = (address if address is not None else self.address[0],
+						port if port is not None else self.address[1])
+
+	def sendto(self, application_data, dst_address=None, dst_port=None):
+		if not isinstance(application_data, str):
+			raise TypeError('application_data must be str, not %s' % type(application_data).__name__)
+		LoopbackSocket._queue((dst_address, dst_port)).put((self.address, application_data))
+
+	def recvfrom(self):
+		return LoopbackSocket._queue(self.address).get()
+
+
+def import_transfer_modules():
+	''' Imports sender.py and receiver.py with LoopbackSocket in place of the lab1 Socket. The ece361 package is
+	only needed on the lab machines, so a placeholder module is registered when it is not installed.'''
+	try:
+		import ece361.network.socket
+	except ImportError:
+		for name in ('ece361', 'ece361.network', 'ece361.network.socket'):
+			sys.modules.setdefault(name, types.ModuleType(name))
+		sys.modules['ece361.network.socket'].Socket = LoopbackSocket
+
+	import sender
+	import receiver
+	sender.Socket = LoopbackSocket
+	receiver.Socket = LoopbackSocket
+	return sender, receiver
+
+
+''' Transfer modes: keyword arguments for send_file and for receive_file.'''
+MODES = {
+	'stopandwait': ({}, {}),
+	'streaming': ({'streaming': True}, {}),
+	'windowed': ({'window_size': 16}, {}),
+	'parallel': ({'streams': [('bench_src%d' % i, 'bench_dst%d' % i) for i in range(4)]}, {}),
+	'writebehind': ({'streaming': True}, {'flush_size': 65536}),
+	'zlib': ({'compression': 'zlib'}, {}),
+	'lzma': ({'compression': 'lzma'}, {}),
+	'delta': ({'delta_block_size': 1024}, {}),
+	'resume': ({'resume': True}, {}),
+}
+
+
+def make_file(path, file_size, sample):
+	''' Writes a test file of file_size bytes by repeating sample (text compresses like the lab files do).'''
+	with open(path, 'wb') as f:
+		remaining = file_size
+		while remaining > 0:
+			f.write(sample[:remaining])
+			remaining -= min(remaining, len(sample))
+
+
+def prepare_delta(receiver, source_file, output_file):
+	''' Leaves an outdated copy of the source as the receiver's basis: one byte is changed in every 64 KiB.'''
+	with open(source_file, 'rb') as f:
+		data = bytearray(f.read())
+	for i in range(0, len(data), 65536):
+		data[i] ^= 0xff
+	with open(output_file, 'wb') as f:
+		f.write(data)
+
+
+def prepare_resume(receiver, source_file, output_file):
+	''' Leaves the first half of the source and its checkpoint behind, as an interrupted transfer would.'''
+	file_size = os.path.getsize(source_file)
+	with open(source_file, 'rb') as f1, open(output_file, 'wb') as f2:
+		f2.write(f1.read(file_size // 2))
+	receiver.Checkpoint(output_file, file_size).save(file_size // 2)
+
+
+''' Modes that start from an existing output file, the function creates it before the transfer.'''
+PREPARE = {
+	'delta': prepare_delta,
+	'resume': prepare_resume,
+}
+
+
+def run_transfer(sender, receiver, source_file, output_file, mode, buffer_size):
+	send_args, receive_args = MODES[mode]
+	if os.path.exists(output_file):
+		os.remove(output_file)
+	if mode in PREPARE:
+		PREPARE[mode](receiver, source_file, output_file)
+
+	sent = []
+	received = []
+	with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+		receiving = threading.Thread(target=receiver.receive_file,
+									 args=('bench', output_file, 'bench_receiver', 'bench_app2', received),
+									 kwargs=receive_args)
+		wall_start = time.perf_counter()
+		cpu_start = time.process_time()
+		receiving.start()
+		sender.send_file('bench', source_file, 'bench_sender', 'bench_app1', 'bench_receiver', 'bench_app2', sent,
+						 buffer_size=buffer_size, **send_args)
+		receiving.join()
+		wall_time = time.perf_counter() - wall_start
+		cpu_time = time.process_time() - cpu_start
+
+	with open(source_file, 'rb') as f1, open(output_file, 'rb') as f2:
+		if f1.read() != f2.read():
+			raise RuntimeError('%s transfer with buffer_size %d corrupted the file' % (mode, buffer_size))
+
+	file_size = sent[0]
+	return {
+		'mode': mode,
+		'buffer_size': buffer_size,
+		'file_size': file_size,
+		'segments': sent[1],
+		'wall_time': wall_time,
+		'cpu_time': cpu_time,
+		'bytes_per_second': file_size / wall_time if wall_time > 0 else 0,
+	}
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--buffer-sizes', type=int, nargs='+', default=[100, 1000, 8192])
+	parser.add_argument('--file-sizes', type=int, nargs='+', default=[10000, 1000000])
+	parser.add_argument('--modes', nargs='+', choices=sorted(MODES), default=sorted(MODES))
+	parser.add_argument('--sample', help='file whose content is repeated to build the test files', default='iso.txt')
+	parser.add_argument('--csv', help='write the results to this CSV file')
+	parser.add_argument('--json', help='write the results to this JSON file')
+	args = parser.parse_args()
+
+	sender, receiver = import_transfer_modules()
+	with open(args.sample, 'rb') as f:
+		sample = f.read()
+
+	results = []
+	with tempfile.TemporaryDirectory() as directory:
+		for file_size in args.file_sizes:
+			source_file = os.path.join(directory, 'source-%d' % file_size)
+			make_file(source_file, file_size, sample)
+			for buffer_size in args.buffer_sizes:
+				for mode in args.modes:
+					result = run_transfer(sender, receiver, source_file, os.path.join(directory, 'output'), mode,
+										  buffer_size)
+					results.append(result)
+					print('%-12s buffer_size %6d  file_size %10d  segments %8d  wall %8.3fs  cpu %8.3fs  %12.1f bytes/s'
+						  % (mode, buffer_size, file_size, result['segments'], result['wall_time'], result['cpu_time'],
+							 result['bytes_per_second']))
+
+	if args.csv:
+		with open(args.csv, 'w', newline='') as f:
+			writer = csv.DictWriter(f, fieldnames=list(results[0].keys()) if results else [])
+			writer.writeheader()
+			writer.writerows(results)
+	if args.json:
+		with open(args.json, 'w') as f:
+			json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+	main()
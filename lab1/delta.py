@@ -0,0 +1,170 @@
+#
+# Copyright 2020 University of Toronto
+#
+# Permission is hereby granted, to use this software and associated
+# documentation files (the "Software") in course work at the University
+# of Toronto, or for personal use. Other uses are prohibited, in
+# particular the distribution of the Software either publicly or to third
+# parties.
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+import hashlib
+import struct
+from transfer import ACK, NACK
+
+''' rsync-style delta transfer for lab1.
+
+The receiver splits the copy of the file it already holds into blocks of block_size bytes and sends a signature of
+each block: a weak rolling checksum and an MD5 digest. The sender slides a block_size window over its file one byte
+at a time. Wherever the window matches one of the receiver's blocks, it sends a copy instruction instead of the
+data. Everything in between is sent as literal data.
+
+Instructions are single segments: b'C' followed by the first block and the number of blocks to copy, or b'L'
+followed by literal bytes.'''
+
+SIGNATURE = struct.Struct('!I16s')
+COPY = struct.Struct('!II')
+
+''' The weak checksum is kept modulo 2^16 in two halves, as in rsync.'''
+MODULUS = 1 << 16
+
+
+def weak_checksum(data):
+	a = 0
+	b = 0
+	length = len(data)
+	for i, x in enumerate(data):
+		a += x
+		b += (length - i) * x
+	return a % MODULUS, b % MODULUS
+
+
+def block_signatures(fd, block_size):
+	signatures = []
+	while True:
+		block = fd.read(block_size)
+		if len(block) == 0:
+			break
+		a, b = weak_checksum(block)
+		signatures.append((a | (b << 16), hashlib.md5(block).digest()))
+	return signatures
+
+
+def compute_delta(fd, signatures, block_size, read_size=65536):
+	''' Yields ('copy', block) and ('literal', byte) instructions that rebuild the file read from fd out of the
+	blocks described by signatures. Only read_size + block_size bytes of the file are held in memory.'''
+	blocks = {}
+	for index, (weak, strong) in enumerate(signatures):
+		blocks.setdefault(weak, {}).setdefault(strong, index)
+
+	buf = bytearray()
+	start = 0
+	end_of_file = False
+	a = None
+	while True:
+		if len(buf) - start <= block_size and not end_of_file:
+			# keep at least one full window plus the byte after it in the buffer
+			del buf[:start]
+			start = 0
+			data = fd.read(read_size)
+			end_of_file = len(data) == 0
+			buf += data
+			continue
+
+		window = min(block_size, len(buf) - start)
+		if window == 0:
+			break
+		if a is None:
+			a, b = weak_checksum(buf[start:start + window])
+
+		match = None
+		candidates = blocks.get(a | (b << 16))
+		if candidates is not None:
+			match = candidates.get(hashlib.md5(buf[start:start + window]).digest())
+
+		if match is not None:
+			yield ('copy', match)
+			start += window
+			a = None
+		else:
+			out = buf[start]
+			yield ('literal', out)
+			if window == block_size and start + block_size < len(buf):
+				# roll the checksum one byte forward
+				a = (a - out + buf[start + block_size]) % MODULUS
+				b = (b - block_size * out + a) % MODULUS
+			else:
+				a = None
+			start += 1
+
+
+def delta_segments(instructions, buffer_size):
+	''' Packs delta instructions into segments of at most buffer_size bytes. Consecutive literal bytes share a
+	segment and copies of consecutive blocks are merged into one instruction.'''
+	literal = bytearray()
+	first = None
+	count = 0
+	for kind, value in instructions:
+		if kind == 'copy':
+			if len(literal) > 0:
+				yield b'L' + bytes(literal)
+				literal = bytearray()
+			if first is not None and value == first + count:
+				count += 1
+				continue
+			if first is not None:
+				yield b'C' + COPY.pack(first, count)
+			first = value
+			count = 1
+		else:
+			if first is not None:
+				yield b'C' + COPY.pack(first, count)
+				first = None
+			literal.append(value)
+			if len(literal) == buffer_size - 1:
+				yield b'L' + bytes(literal)
+				literal = bytearray()
+	if first is not None:
+		yield b'C' + COPY.pack(first, count)
+	if len(literal) > 0:
+		yield b'L' + bytes(literal)
+
+
+def send_signatures(s, signatures, destination_address, destination_port, buffer_size=100):
+	''' Sends the block signatures to the sender with stop-and-wait: first the number of signatures, then as many
+	signatures per message as fit in buffer_size bytes.'''
+	per_message = max(1, buffer_size // SIGNATURE.size)
+	messages = [str(len(signatures)).encode()]
+	for i in range(0, len(signatures), per_message):
+		messages.append(b''.join(SIGNATURE.pack(weak, strong) for weak, strong in signatures[i:i + per_message]))
+	for message in messages:
+		while True:
+			s.sendto(message, dst_address=destination_address, dst_port=destination_port)
+			a, b = s.recvfrom()
+			if b == ACK:
+				break
+
+
+def receive_signatures(s):
+	a, b = s.recvfrom()
+	count = int(b)
+	s.sendto(ACK, dst_address=a[0], dst_port=a[1])
+	signatures = []
+	while len(signatures) < count:
+		a, b = s.recvfrom()
+		if len(b) == 0 or len(b) % SIGNATURE.size != 0:
+			s.sendto(NACK, dst_address=a[0], dst_port=a[1])
+			continue
+		signatures.extend(SIGNATURE.iter_unpack(b))
+		s.sendto(ACK, dst_address=a[0], dst_port=a[1])
+	return signatures
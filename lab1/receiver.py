@@ -19,8 +19,306 @@
 # SOFTWARE.
 #
 from ece361.network.socket import Socket
+from concurrent.futures import ThreadPoolExecutor, wait
+from transfer import unpack_file_info, unpack_segment, pack_ack, split_ranges, DECOMPRESSORS
+from transfer import unpack_file_header, ByteSocket, ACK, NACK
+from delta import COPY, block_signatures, send_signatures
+import os
+import queue
+import sys
+import threading
+
+''' Batch size used for resumable transfers when receive_file is not given a flush_size.'''
+DEFAULT_FLUSH_SIZE = 1048576
+
+
+class Checkpoint:
+	''' Remembers in <file_name>.checkpoint how many bytes of <file_name> are known to be on disk, so that an
+	interrupted transfer can resume from there instead of from byte 0.'''
+	def __init__(self, file_name, file_size):
+		self.file_name = file_name
+		self.file_size = file_size
+		self.path = file_name + '.checkpoint'
+
+	def load(self):
+		''' Returns the offset to resume from, 0 if there is no usable checkpoint for a file of this size.'''
+		try:
+			with open(self.path, 'r') as f:
+				committed, file_size = (int(field) for field in f.read().split())
+			if file_size != self.file_size or committed > os.path.getsize(self.file_name):
+				return 0
+			return committed
+		except (OSError, ValueError):
+			return 0
+
+	def save(self, committed):
+		temporary_path = self.path + '.tmp'
+		with open(temporary_path, 'w') as f:
+			f.write('%d %d' % (committed, self.file_size))
+			f.flush()
+			os.fsync(f.fileno())
+		os.replace(temporary_path, self.path)
+
+	def remove(self):
+		if os.path.exists(self.path):
+			os.remove(self.path)
+
+
+class WriteBehind:
+	''' Takes the place of the output file descriptor so that writing a segment only queues it in memory. A
+	background thread joins the queued segments and writes them in batches of at least flush_size bytes, so the
+	receive loop can send its ACK without waiting on the disk. close() writes what is left, fsyncs the file and
+	closes it.
+
+	With a checkpoint, every batch is fsynced and then recorded in the checkpoint, counting from offset (the
+	position the file was opened at), so at most one batch is lost if the transfer is interrupted.'''
+	def __init__(self, fd, flush_size, checkpoint=None, offset=0):
+		self.fd = fd
+		self.flush_size = flush_size
+		self.checkpoint = checkpoint
+		self.committed = offset
+		self.pending = queue.Queue()
+		self.error = None
+		self.writer = threading.Thread(target=self._write_batches, daemon=True)
+		self.writer.start()
+
+	def write(self, data):
+		self.pending.put(data)
+		return len(data)
+
+	def _write_batches(self):
+		batch = []
+		batch_size = 0
+		try:
+			while True:
+				data = self.pending.get()
+				if data is None:
+					break
+				batch.append(data)
+				batch_size += len(data)
+				if batch_size >= self.flush_size:
+					self._commit(batch, batch_size)
+					batch = []
+					batch_size = 0
+			self._commit(batch, batch_size)
+			if self.checkpoint is None:
+				self.fd.flush()
+				os.fsync(self.fd.fileno())
+		except OSError as e:
+			self.error = e
+
+	def _commit(self, batch, batch_size):
+		if batch_size > 0:
+			self.fd.write(b''.join(batch))
+		if self.checkpoint is not None:
+			self.fd.flush()
+			os.fsync(self.fd.fileno())
+			self.committed += batch_size
+			self.checkpoint.save(self.committed)
+
+	def close(self):
+		self.pending.put(None)
+		self.writer.join()
+		self.fd.close()
+		if self.error is not None:
+			raise self.error
+
+
+def receive_stop_and_wait(s, fd, file_size):
+	''' Receives file_size bytes with the original stop-and-wait protocol. Returns the number of bytes and segments
+	received.'''
+	received_buffer = 0
+	segment_counter = 0
+	while True:
+		''' Part 3. You need to compare the buffer_size with the actual file size as a condition to
+		 continue to receive the file chunks.
+
+		For each message you receive, send an "ACK" and write that chunk in the file you just created.
+		You only need to send an "ACK" if the size of the data you received is larger than zero and if not, you will
+		send a "NACK". After sending a "NACK" you need to redo the same steps until you receive a file chunk which is
+		more than zero bytes. Afterwards, you will send an "ACK" to the sender and you can pass to the next chunk.'''
+		if not transfer_complete(fd, received_buffer, file_size):
+
+
+			''' Your Code'''
+			a, b = s.recvfrom()
+			if len(b) > 0:
+				s.sendto(ACK, dst_address=a[0], dst_port=a[1])
+				received_buffer += fd.write(b)
+				segment_counter +=1
+
+				print('Acknowledged! --> Segment: ', segment_counter,'|Amount of data received so far: ', received_buffer)
+			else:
+				s.sendto(NACK, dst_address=a[0], dst_port=a[1])
+		else:
+			break
+	return received_buffer, segment_counter
+
+
+class DeltaWriter:
+	''' Takes the place of the output file descriptor in a delta transfer. Each write() is one delta instruction:
+	copies are read from the basis file (the copy the receiver already held) and literals are taken as they are.
+	write() returns the number of bytes the instruction added to the rebuilt file.'''
+	def __init__(self, basis, fd, block_size, copy_size=1048576):
+		self.basis = basis
+		self.fd = fd
+		self.block_size = block_size
+		self.copy_size = copy_size
+
+	def write(self, instruction):
+		if instruction[:1] == b'L':
+			return self.fd.write(instruction[1:])
+
+		first, count = COPY.unpack_from(instruction, 1)
+		self.basis.seek(first * self.block_size)
+		remaining = count * self.block_size
+		written = 0
+		while remaining > 0:
+			data = self.basis.read(min(remaining, self.copy_size))
+			if len(data) == 0:
+				break
+			self.fd.write(data)
+			written += len(data)
+			remaining -= len(data)
+		return written
+
+	def close(self):
+		if self.basis is not None:
+			self.basis.close()
+		self.fd.close()
+
+
+class DecompressWriter:
+	''' Takes the place of the output file descriptor in a compressed transfer and decompresses each segment before
+	writing it. write() returns the number of decompressed bytes written.'''
+	def __init__(self, fd, method):
+		self.fd = fd
+		self.decompressor = DECOMPRESSORS[method]()
+
+	''' The compressed stream can end a few bytes after the last file byte was decompressed.'''
+	@property
+	def eof(self):
+		return self.decompressor.eof
+
+	def write(self, data):
+		return self.fd.write(self.decompressor.decompress(data))
+
+	def close(self):
+		self.fd.close()
+
+
+class SessionWriter:
+	''' Takes the place of the output file descriptor in a session (see sender.SenderSession) and splits the stream
+	of segments back into files using the per-file headers. Files are written to directory under the name the
+	sender gave them. eof is set once the sender closes the session.'''
+	def __init__(self, directory, flush_size=None):
+		self.directory = directory
+		self.flush_size = flush_size
+		self.fd = None
+		self.remaining = 0
+		self.eof = False
+		self.files = []
+
+	def write(self, segment):
+		if self.fd is None:
+			file_size, name, segment = unpack_file_header(segment)
+			if name == '':
+				self.eof = True
+				return 0
+			self.fd = open(os.path.join(self.directory, os.path.basename(name)), 'wb')
+			if self.flush_size is not None:
+				self.fd = WriteBehind(self.fd, self.flush_size)
+			self.remaining = file_size
+			self.files.append(name)
+
+		if len(segment) > 0:
+			self.fd.write(segment)
+			self.remaining -= len(segment)
+		if self.remaining <= 0:
+			self.fd.close()
+			self.fd = None
+		return len(segment)
+
+	def close(self):
+		if self.fd is not None:
+			self.fd.close()
+
+
+def transfer_complete(fd, received_buffer, file_size):
+	''' The transfer is complete once file_size bytes are written and, for a compressed transfer, the end of the
+	compressed stream has arrived.'''
+	return received_buffer >= file_size and getattr(fd, 'eof', True)
+
+
+def receive_windowed(s, fd, file_size):
+	''' Receives sequence-numbered segments from a windowed sender. Only the next expected segment is written; every
+	written segment is acknowledged with "ACK <n>" where n is the next expected segment. A gap is reported once with
+	"NACK <n>" so the sender goes back to segment n instead of waiting for each missing segment in turn.
+	Returns the number of bytes and segments received.'''
+	received_buffer = 0
+	segment_counter = 0
+	rnext = 0
+	nacked = None
+	while not transfer_complete(fd, received_buffer, file_size):
+		a, b = s.recvfrom()
+		seqnum, data = unpack_segment(b)
+		if seqnum == rnext and len(data) > 0:
+			received_buffer += fd.write(data)
+			segment_counter +=1
+			rnext += 1
+			s.sendto(pack_ack(ACK, rnext), dst_address=a[0], dst_port=a[1])
+			print('Acknowledged! --> Segment: ', segment_counter,'|Amount of data received so far: ', received_buffer)
+		elif seqnum < rnext:
+			# duplicate of a segment that is already written, repeat the cumulative ACK
+			s.sendto(pack_ack(ACK, rnext), dst_address=a[0], dst_port=a[1])
+		elif nacked != rnext:
+			s.sendto(pack_ack(NACK, rnext), dst_address=a[0], dst_port=a[1])
+			nacked = rnext
+	return received_buffer, segment_counter
+
+
+def receive_range(s, file_name, offset, length, windowed, flush_size=None):
+	''' Receives one byte range of a parallel transfer on its own socket and writes it in place.'''
+	fd = open(file_name, 'r+b')
+	fd.seek(offset)
+	if flush_size is not None:
+		fd = WriteBehind(fd, flush_size)
+	try:
+		if windowed:
+			return receive_windowed(s, fd, length)
+		return receive_stop_and_wait(s, fd, length)
+	finally:
+		fd.close()
+
+
+def receive_parallel(stream_sockets, file_name, file_size, windowed, flush_size=None):
+	''' Receives a file that the sender split into one byte range per stream socket (see transfer.split_ranges).
+	The output file is preallocated so every range can be written at its offset as soon as it arrives.
+	Returns the total number of bytes and segments received.'''
+	with open(file_name, 'wb') as fd:
+		fd.truncate(file_size)
+
+	with ThreadPoolExecutor(max_workers=len(stream_sockets)) as pool:
+		futures = [pool.submit(receive_range, stream_socket, file_name, offset, length, windowed, flush_size)
+				   for stream_socket, (offset, length) in zip(stream_sockets, split_ranges(file_size, len(stream_sockets)))]
+		results = [future.result() for future in futures]
+
+	return sum(received for received, segments in results), sum(segments for received, segments in results)
+
+
+def receive_file(student_id, file_name, source_address, source_port, extra_args, flush_size=None):
+	''' When flush_size is set, received segments are written behind the receive loop in batches of flush_size bytes
+	(see WriteBehind) and the output file is fsynced once the transfer completes.
+
+	If the sender asks to resume, the receiver answers the file size message with "ACK <offset>", where offset is
+	the number of bytes recorded in <file_name>.checkpoint by an earlier, interrupted transfer of the same file.
+	<file_name> is cut back to offset and the rest of the file is appended, checkpointing after every flush_size
+	(or DEFAULT_FLUSH_SIZE) bytes. The checkpoint is removed once the transfer completes.
+
+	If the sender asks for a delta transfer, the existing <file_name> is used as the basis: its block signatures
+	are sent to the sender and the file is rebuilt from copy and literal instructions into <file_name>.delta, which
+	then replaces <file_name>.'''
 
-def receive_file(student_id, file_name, source_address, source_port, extra_args):
 	''' The counter keeps track of the number of segments the receiver receives from the sender and must be increased
 	as the receiver continues to get more segments.'''
 	segment_counter = 0
@@ -29,7 +327,7 @@ def receive_file(student_id, file_name, source_address, source_port, extra_args)
 	and port to the source_address and source_port that is passed as an argument to this function.'''
 
 	''' Your Code'''
-	s = Socket(student_id)
+	s = ByteSocket(Socket(student_id))
 	s.change_source_address(address=source_address, port=source_port)
 	''' Use this variable to keep track on how much data you have received so far.'''
 	received_buffer = 0
@@ -41,52 +339,200 @@ def receive_file(student_id, file_name, source_address, source_port, extra_args)
 
 		a, b = s.recvfrom()
 		if len(b) > 0:
-			s.sendto('ACK', dst_address=a[0], dst_port=a[1])
-			file_size = int(b)
+			file_size, options = unpack_file_info(b)
+			if 'streams' in options:
+				# the stream ports must be open before the sender is told to start
+				stream_sockets = []
+				for port in options['streams'].split(','):
+					stream_socket = ByteSocket(Socket(student_id))
+					stream_socket.change_source_address(address=source_address, port=port)
+					stream_sockets.append(stream_socket)
+			if 'resume' in options:
+				checkpoint = Checkpoint(file_name, file_size)
+				offset = checkpoint.load()
+				s.sendto(pack_ack(ACK, offset), dst_address=a[0], dst_port=a[1])
+			else:
+				s.sendto(ACK, dst_address=a[0], dst_port=a[1])
 			break
 		else:
-			s.sendto('NACK', dst_address=a[0], dst_port=a[1])
+			s.sendto(NACK, dst_address=a[0], dst_port=a[1])
 		''' Your Code'''
 
-	''' This creates the destination file name to hold the senders data.'''
-	fd = open(file_name, 'a+')
-	while True:
-		''' Part 3. You need to compare the buffer_size with the actual file size as a condition to
-		 continue to receive the file chunks.
+	if 'delta' in options:
+		block_size = int(options['delta'])
+		basis = open(file_name, 'rb') if os.path.exists(file_name) else None
+		signatures = block_signatures(basis, block_size) if basis is not None else []
+		send_signatures(s, signatures, a[0], a[1])
 
-		For each message you receive, send an "ACK" and write that chunk in the file you just created.
-		You only need to send an "ACK" if the size of the data you received is larger than zero and if not, you will
-		send a "NACK". After sending a "NACK" you need to redo the same steps until you receive a file chunk which is
-		more than zero bytes. Afterwards, you will send an "ACK" to the sender and you can pass to the next chunk.'''
-		if received_buffer < file_size:
+		fd = open(file_name + '.delta', 'wb')
+		if flush_size is not None:
+			fd = WriteBehind(fd, flush_size)
+		fd = DeltaWriter(basis, fd, block_size)
+		if 'window' in options:
+			received_buffer, segment_counter = receive_windowed(s, fd, file_size)
+		else:
+			received_buffer, segment_counter = receive_stop_and_wait(s, fd, file_size)
+		fd.close()
+		os.replace(file_name + '.delta', file_name)
+	elif 'resume' in options:
+		print('Resuming at byte', offset)
+		fd = open(file_name, 'r+b' if os.path.exists(file_name) else 'wb')
+		fd.truncate(offset)
+		fd.seek(offset)
+		fd = WriteBehind(fd, flush_size or DEFAULT_FLUSH_SIZE, checkpoint, offset)
+		if 'window' in options:
+			received_buffer, segment_counter = receive_windowed(s, fd, file_size - offset)
+		else:
+			received_buffer, segment_counter = receive_stop_and_wait(s, fd, file_size - offset)
+		fd.close()
+		checkpoint.remove()
+	elif 'streams' in options:
+		received_buffer, segment_counter = receive_parallel(stream_sockets, file_name, file_size, 'window' in options,
+															flush_size)
+	else:
+		''' This creates the destination file name to hold the senders data.'''
+		fd = open(file_name, 'ab')
+		if flush_size is not None:
+			fd = WriteBehind(fd, flush_size)
+		if 'compress' in options:
+			fd = DecompressWriter(fd, options['compress'])
+		if 'window' in options:
+			received_buffer, segment_counter = receive_windowed(s, fd, file_size)
+		else:
+			received_buffer, segment_counter = receive_stop_and_wait(s, fd, file_size)
+		''' You need to close the file descriptor to empty out the output buffer on the disk.'''
+		fd.close()
+	print('The file transmission is now completed!')
+	extra_args.append(received_buffer)
+	extra_args.append(segment_counter)
 
 
-			''' Your Code'''
-			a, b = s.recvfrom()
-			if len(b) > 0:
-				s.sendto('ACK', dst_address=a[0], dst_port=a[1])
-				received_buffer += len(b)
-				segment_counter +=1
+def receive_session(student_id, directory, source_address, source_port, extra_args, flush_size=None):
+	''' Receives every file of a sender session (see sender.SenderSession) into directory. The session is opened
+	with one file size message, after which the files arrive back to back over the windowed protocol. For every
+	file its name is appended to extra_args, followed by the total number of bytes and segments received.'''
+	s = ByteSocket(Socket(student_id))
+	s.change_source_address(address=source_address, port=source_port)
 
-				print('Acknowledged! --> Segment: ', segment_counter,'|Amount of data received so far: ', received_buffer)
-				fd.write(b)
-			else:
-				s.sendto('NACK', dst_address=a[0], dst_port=a[1])
-		else:
-			''' You need to close the file descriptor to empty out the output buffer on the disk.'''
-			fd.close()
-			break
-	print('The file transmission is now completed!')
+	while True:
+		a, b = s.recvfrom()
+		if len(b) > 0:
+			file_size, options = unpack_file_info(b)
+			if 'session' in options:
+				s.sendto(ACK, dst_address=a[0], dst_port=a[1])
+				break
+		s.sendto(NACK, dst_address=a[0], dst_port=a[1])
+
+	fd = SessionWriter(directory, flush_size)
+	received_buffer, segment_counter = receive_windowed(s, fd, 0)
+	fd.close()
+	print('The session is now completed!', len(fd.files), 'files received')
+	extra_args.extend(fd.files)
 	extra_args.append(received_buffer)
 	extra_args.append(segment_counter)
 
 
-extra_arguments = []
-''' Please replace the input arguments that start with Your_... with your information.'''
-receive_file('1000479573', 'iso_copy.txt', 'ece362', 'app2',
-				   extra_arguments)
+class Transfer:
+	''' The state serve_files keeps for one sender. Segments are accepted in order on the receive loop and written
+	by the thread pool, each at its offset in the sender's own output file.'''
+	def __init__(self, address, file_name, file_size, windowed):
+		self.address = address
+		self.file_name = file_name
+		self.file_size = file_size
+		self.windowed = windowed
+		self.fd = open(file_name, 'wb')
+		self.received_buffer = 0
+		self.segment_counter = 0
+		self.rnext = 0
+		self.nacked = None
+		self.pending = []
+
+	def accept(self, data, pool):
+		if len(self.pending) >= 64:
+			self.pending = [write for write in self.pending if not write.done()]
+		self.pending.append(pool.submit(os.pwrite, self.fd.fileno(), data, self.received_buffer))
+		self.received_buffer += len(data)
+		self.segment_counter +=1
+
+	def finish(self):
+		''' Waits for the outstanding writes, then fsyncs and closes the output file.'''
+		wait(self.pending)
+		try:
+			for write in self.pending:
+				write.result()
+			os.fsync(self.fd.fileno())
+		finally:
+			self.fd.close()
+
+
+def serve_files(student_id, file_name, source_address, source_port, extra_args, max_workers=4, max_transfers=None):
+	''' Receives files from many senders at the same time on one socket. Messages are demultiplexed by the sender
+	address (the a tuple returned by s.recvfrom()): the first message from a new address is its file size message
+	and every sender gets its own Transfer and output file, <address>-<port>-<file_name>. Disk writes run on a pool
+	of max_workers threads, so a slow disk does not hold up the ACKs of other senders.
+
+	Senders may use the original stop-and-wait protocol or the windowed protocol. Transfers that ask for any other
+	option (streams, delta, compress) are ignored. Serves forever unless max_transfers is set. For every completed
+	transfer (sender address, bytes received, segments received) is appended to extra_args.'''
+	s = ByteSocket(Socket(student_id))
+	s.change_source_address(address=source_address, port=source_port)
+	directory, base_name = os.path.split(file_name)
+
+	transfers = {}
+	finishing = []
+	with ThreadPoolExecutor(max_workers=max_workers) as pool:
+		while max_transfers is None or len(finishing) < max_transfers:
+			a, b = s.recvfrom()
+			address = tuple(a)
+			transfer = transfers.get(address)
+			if transfer is None:
+				# a new sender starts with its file size message, anything else is a leftover of an earlier transfer
+				try:
+					file_size, options = unpack_file_info(b)
+				except (TypeError, ValueError):
+					continue
+				if len(set(options) - {'window'}) > 0:
+					print('Ignoring transfer from', a, 'with unsupported options', options, file=sys.stderr)
+					continue
+				transfer = Transfer(address, os.path.join(directory, '%s-%s-%s' % (a[0], a[1], base_name)),
+									file_size, 'window' in options)
+				transfers[address] = transfer
+				s.sendto(ACK, dst_address=a[0], dst_port=a[1])
+				print('Receiving', file_size, 'bytes from', a, 'into', transfer.file_name)
+			elif transfer.windowed:
+				seqnum, data = unpack_segment(b)
+				if seqnum == transfer.rnext and len(data) > 0:
+					transfer.accept(data, pool)
+					transfer.rnext += 1
+					s.sendto(pack_ack(ACK, transfer.rnext), dst_address=a[0], dst_port=a[1])
+				elif seqnum < transfer.rnext:
+					s.sendto(pack_ack(ACK, transfer.rnext), dst_address=a[0], dst_port=a[1])
+				elif transfer.nacked != transfer.rnext:
+					s.sendto(pack_ack(NACK, transfer.rnext), dst_address=a[0], dst_port=a[1])
+					transfer.nacked = transfer.rnext
+			elif len(b) > 0:
+				s.sendto(ACK, dst_address=a[0], dst_port=a[1])
+				transfer.accept(b, pool)
+			else:
+				s.sendto(NACK, dst_address=a[0], dst_port=a[1])
+
+			if transfer.received_buffer >= transfer.file_size:
+				del transfers[address]
+				finishing.append(pool.submit(transfer.finish))
+				extra_args.append((a, transfer.received_buffer, transfer.segment_counter))
+				print('The file transmission from', a, 'is now completed!')
+
+	for finish in finishing:
+		finish.result()
+
+
+if __name__ == '__main__':
+	extra_arguments = []
+	''' Please replace the input arguments that start with Your_... with your information.'''
+	receive_file('1000479573', 'iso_copy.txt', 'ece362', 'app2',
+					   extra_arguments)
 
-print(extra_arguments)
+	print(extra_arguments)
 
 
 ''' Important Information: An ACK or a NACK message is only a message with an ACK/NACK as its data. Therefore, it
@@ -19,31 +19,222 @@
 # SOFTWARE.
 #
 from ece361.network.socket import Socket
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from transfer import pack_file_info, pack_segment, unpack_ack, split_ranges, CompressedSegments, COMPRESSORS
+from transfer import pack_file_header, ByteSocket, ACK, NACK
+from delta import compute_delta, delta_segments, receive_signatures
 import os
+import time
 
 
-def send_file(student_id, file_name, source_address, source_port, destination_address, destination_port, extra_args):
+def read_segments(fd, buffer_size, length=None):
+	''' Yields the file one segment at a time so that only the segments in flight are held in memory. If length is
+	given, at most length bytes are read from the current position.'''
+	while length is None or length > 0:
+		segment = fd.read(buffer_size if length is None else min(buffer_size, length))
+		if len(segment) == 0:
+			break
+		if length is not None:
+			length -= len(segment)
+		yield segment
+
+
+def send_stop_and_wait(s, segments, destination_address, destination_port):
+	''' Sends each segment and only moves on to the next one once it is acknowledged. A NACK resends the segment
+	that is still in hand. Returns the number of segments delivered.'''
+	segment_counter = 0
+	for segment in segments:
+		while True:
+			s.sendto(segment, dst_address=destination_address, dst_port=destination_port)
+			a, b = s.recvfrom()
+			if b == ACK:
+				break
+		segment_counter +=1
+		print('Segment: ', segment_counter,'|',len(segment), "Bytes is sent!")
+	return segment_counter
+
+
+def send_windowed(s, segments, window_size, destination_address, destination_port, first_seqnum=0):
+	''' Keeps up to window_size sequence-numbered segments in flight instead of idling for a round trip after every
+	segment. The receiver acknowledges cumulatively, so one "ACK <n>" releases every segment before n, and answers a
+	gap with "NACK <n>", after which every segment still in flight is sent again starting from n.
+	Segments are numbered from first_seqnum. Returns the number of segments delivered.'''
+	segment_counter = 0
+	in_flight = deque()
+	next_seqnum = first_seqnum
+	segments = iter(segments)
+	end_of_file = False
+	while True:
+		# fill up the window
+		while not end_of_file and len(in_flight) < window_size:
+			segment = next(segments, None)
+			if segment is None:
+				end_of_file = True
+				break
+			s.sendto(pack_segment(next_seqnum, segment), dst_address=destination_address, dst_port=destination_port)
+			in_flight.append((next_seqnum, segment))
+			next_seqnum += 1
+
+		if len(in_flight) == 0:
+			break
+
+		a, b = s.recvfrom()
+		reply, ack_seqnum = unpack_ack(b)
+		while len(in_flight) > 0 and in_flight[0][0] < ack_seqnum:
+			seqnum, segment = in_flight.popleft()
+			segment_counter +=1
+			print('Segment: ', segment_counter,'|',len(segment), "Bytes is sent!")
+
+		if reply == NACK:
+			for seqnum, segment in in_flight:
+				s.sendto(pack_segment(seqnum, segment), dst_address=destination_address, dst_port=destination_port)
+	return segment_counter
+
+
+def send_range(student_id, file_name, offset, length, source_address, source_port, destination_address,
+			   destination_port, buffer_size, window_size):
+	''' Sends one byte range of a parallel transfer over its own socket. Returns the number of segments delivered.'''
+	s = ByteSocket(Socket(student_id))
+	s.change_source_address(address=source_address, port=source_port)
+	with open(file_name, 'rb') as fd:
+		fd.seek(offset)
+		segments = read_segments(fd, buffer_size, length)
+		if window_size is not None:
+			return send_windowed(s, segments, window_size, destination_address, destination_port)
+		return send_stop_and_wait(s, segments, destination_address, destination_port)
+
+
+def send_parallel(student_id, file_name, file_size, source_address, destination_address, streams, buffer_size,
+				  window_size):
+	''' Splits the file into one byte range per (source_port, destination_port) pair in streams and sends all
+	ranges at the same time from a worker pool. Returns the total number of segments delivered.'''
+	with ThreadPoolExecutor(max_workers=len(streams)) as pool:
+		futures = [pool.submit(send_range, student_id, file_name, offset, length, source_address, stream_source_port,
+							   destination_address, stream_destination_port, buffer_size, window_size)
+				   for (stream_source_port, stream_destination_port), (offset, length)
+				   in zip(streams, split_ranges(file_size, len(streams)))]
+		return sum(future.result() for future in futures)
+
+
+class SenderSession:
+	''' Keeps one Socket and its association with one receiver (see receiver.receive_session) open and sends many
+	files over it back to back. The session is opened with a single file size message ("0;session=1;window=<N>");
+	after that all files share one windowed stream of segments and each file is announced by a header segment
+	(see transfer.pack_file_header) instead of a separate file size exchange. The window stays full across file
+	boundaries within one send_files() call.'''
+	def __init__(self, student_id, source_address, source_port, destination_address, destination_port,
+				 window_size=16, buffer_size=100):
+		self.destination_address = destination_address
+		self.destination_port = destination_port
+		self.window_size = window_size
+		self.buffer_size = buffer_size
+		self.next_seqnum = 0
+		self.files_sent = 0
+
+		self.s = ByteSocket(Socket(student_id))
+		self.s.change_source_address(address=source_address, port=source_port)
+		file_info = pack_file_info(0, session=1, window=window_size)
+		while True:
+			self.s.sendto(file_info, dst_address=destination_address, dst_port=destination_port)
+			a, b = self.s.recvfrom()
+			if b == ACK:
+				break
+
+	def _file_segments(self, file_names):
+		for file_name in file_names:
+			with open(file_name, 'rb') as fd:
+				file_size = os.stat(file_name).st_size
+				name = os.path.basename(file_name)
+				header_size = len(pack_file_header(file_size, name))
+				yield pack_file_header(file_size, name, fd.read(max(0, self.buffer_size - header_size)))
+				for segment in read_segments(fd, self.buffer_size):
+					yield segment
+			self.files_sent += 1
+
+	def _send(self, segments):
+		segment_counter = send_windowed(self.s, segments, self.window_size, self.destination_address,
+										self.destination_port, self.next_seqnum)
+		self.next_seqnum += segment_counter
+		return segment_counter
+
+	def send_files(self, file_names):
+		''' Sends the files one after another and returns the number of segments delivered.'''
+		return self._send(self._file_segments(file_names))
+
+	def send_file(self, file_name):
+		return self.send_files([file_name])
+
+	def close(self):
+		''' Ends the session on the receiver.'''
+		self._send([pack_file_header(0, '')])
+
+
+def send_file(student_id, file_name, source_address, source_port, destination_address, destination_port, extra_args,
+			  streaming=False, window_size=None, streams=None, delta_block_size=None, compression=None,
+			  resume=False, buffer_size=100):
+	''' When streaming is True the file is read in binary, one segment at a time, so memory use stays at a single
+	segment no matter how big the file is.
+
+	When window_size is set, up to window_size sequence-numbered segments are kept in flight (see send_windowed).
+	The window size is announced to the receiver with the file size. Windowed transfers always stream the file.
+
+	When streams is a list of (source_port, destination_port) pairs, the file is split into one byte range per pair
+	and the ranges are sent in parallel, each over its own socket (see send_parallel). The handshake still uses
+	source_port and destination_port.
+
+	When delta_block_size is set, the receiver first sends signatures of the blocks of the copy it already holds and
+	only the changed regions are sent, everything else becomes a copy instruction (see delta.py). Delta transfers
+	always stream the file and cannot be combined with streams.
+
+	When compression is 'zlib' or 'lzma', the file is compressed as it is read and the receiver decompresses the
+	segments as they arrive. The method is agreed on in the file size message and the summary reports the
+	compression ratio and the effective throughput. Compressed transfers cannot be combined with streams or
+	delta_block_size.
+
+	When resume is True, the receiver is asked for the checkpoint of an earlier, interrupted transfer of the file
+	and sending continues from the offset it reports. Resumable transfers always stream the file and cannot be
+	combined with streams, delta_block_size or compression.'''
+	if delta_block_size is not None and streams is not None:
+		raise ValueError('delta transfers cannot be split into parallel streams')
+	if compression is not None:
+		if compression not in COMPRESSORS:
+			raise ValueError('unknown compression method %s' % compression)
+		if streams is not None or delta_block_size is not None:
+			raise ValueError('compression cannot be combined with parallel streams or delta transfers')
+	if resume and (streams is not None or delta_block_size is not None or compression is not None):
+		raise ValueError('only plain and windowed transfers can be resumed')
+	t_start = time.time()
+
 	''' The counter keeps track of the number of segments transmitted to the receiver.'''
 	segment_counter = 0
-	''' The maximum size of each message data.'''
-	buffer_size = 100
+	''' The maximum size of each message data is buffer_size.'''
 
 	''' Part 1. Create a socket here by using your student_id as an input argument and change the source address 
 	and port to the source_address and source_port that is passed as an argument to this function.'''
 
 	''' Your Code'''
-	s = Socket(student_id)
+	s = ByteSocket(Socket(student_id))
 
 	s.change_source_address(address=source_address, port=source_port)
 	print(source_address,source_port)
 
 	''' Part 2. Use the socket you just created to send the size of the <file_name> to the receiver.'''
-	fd = open(file_name, 'r')
-	fd_text = fd.read()
-	fd_total = len(fd_text)
+	streaming = (streaming or window_size is not None or streams is not None or delta_block_size is not None
+				 or compression is not None or resume)
+	if streaming:
+		fd = open(file_name, 'rb')
+		fd_total = os.stat(file_name).st_size
+	else:
+		fd = open(file_name, 'rb')
+		fd_text = fd.read()
+		fd_total = len(fd_text)
 	''' Your Code'''
 
-	s.sendto(str(fd_total), dst_address=destination_address, dst_port=destination_port)
+	file_info = pack_file_info(fd_total, window=window_size,
+							   streams=None if streams is None else ','.join(port for _, port in streams),
+							   delta=delta_block_size, compress=compression, resume=1 if resume else None)
+	s.sendto(file_info, dst_address=destination_address, dst_port=destination_port)
 	print('The file size: ', fd_total)
 	while True:
 		''' Part 3. Use the socket you created to listen for incoming Acknowledgement message. The ACK will confirm
@@ -55,14 +246,37 @@ def send_file(student_id, file_name, source_address, source_port, destination_ad
 		''' Part 4. You need to implement a mechanism to check if the incoming message is an "ACK" or a "NACK" and
 		resend the data if it is a NACK. After resending, you need to check again for the acknowledgement. You can
 		only go to the next part of the code if you receive an ACK message.'''
-		if b == "ACK":
+		if b == ACK:
+			break
+		elif resume and b.startswith(ACK + b' '):
+			# the receiver answers a resume request with the offset it has committed
+			reply, offset = unpack_ack(b)
+			fd.seek(offset)
+			print('Resuming at byte', offset)
 			break
-		elif b =="NACK":
-			s.sendto(fd_total, dst_address=destination_address, dst_port=destination_port)	
+		elif b == NACK:
+			s.sendto(file_info, dst_address=destination_address, dst_port=destination_port)
 					
     #fd = open(file_name, 'r')
 	i = 0
-	while True:
+	segments = read_segments(fd, buffer_size) if streaming else None
+	if delta_block_size is not None:
+		signatures = receive_signatures(s)
+		print('Receiver holds', len(signatures), 'blocks of', delta_block_size, 'bytes')
+		segments = delta_segments(compute_delta(fd, signatures, delta_block_size), buffer_size)
+	if compression is not None:
+		# hand the compressor large chunks, the compressed stream is cut into buffer_size segments
+		segments = CompressedSegments(read_segments(fd, max(buffer_size, 65536)), compression, buffer_size)
+
+	if streams is not None:
+		segment_counter = send_parallel(student_id, file_name, fd_total, source_address, destination_address,
+										streams, buffer_size, window_size)
+	elif window_size is not None:
+		segment_counter = send_windowed(s, segments, window_size, destination_address, destination_port)
+	elif streaming:
+		segment_counter = send_stop_and_wait(s, segments, destination_address, destination_port)
+
+	while not streaming:
 		''' Part 5. You need to implement a mechanism that read chunks of the data from the file that is equivalent 
 		to the size of the <buffer_size> variable. 
 		After reading from the file, you need to send the file chunk to the specified destination and wait 
@@ -71,7 +285,7 @@ def send_file(student_id, file_name, source_address, source_port, destination_ad
 		if i < (fd_total-buffer_size):
 			s.sendto(fd_text[i:i+buffer_size], dst_address=destination_address, dst_port=destination_port)
 			a, b = s.recvfrom()
-			if b == 'ACK':
+			if b == ACK:
 				i += buffer_size
 				segment_counter +=1	
 				print('Segment: ', segment_counter,'|',buffer_size, "Bytes is sent!")
@@ -79,7 +293,7 @@ def send_file(student_id, file_name, source_address, source_port, destination_ad
 			s.sendto(fd_text[i:], dst_address=destination_address, dst_port=destination_port)	
 
 			a, b = s.recvfrom()
-			if b == 'ACK':
+			if b == ACK:
 				segment_counter +=1	
 				print('Segment: ', segment_counter,'|',fd_total-i, "Bytes is sent!")
 				break
@@ -95,18 +309,24 @@ def send_file(student_id, file_name, source_address, source_port, destination_ad
 	''' The file descriptor must be closed after the transfer is completed.'''
 	fd.close()
 	print('File transmission is completed!')
+	if compression is not None:
+		elapsed = time.time() - t_start
+		print('Compression ratio: %.2f (%d bytes sent as %d)' % (segments.bytes_in / max(segments.bytes_out, 1),
+																  segments.bytes_in, segments.bytes_out))
+		print('Effective throughput: %.1f bytes/s' % (fd_total / elapsed if elapsed > 0 else 0))
 	file_size = fd_total 
 	extra_args.append(file_size)
 	extra_args.append(segment_counter)
 
 
-extra_arguments = []
-''' Please replace the input arguments that start with Your_... with your information.'''
+if __name__ == '__main__':
+	extra_arguments = []
+	''' Please replace the input arguments that start with Your_... with your information.'''
 
-send_file('1000479573', 'iso.txt', 'ece361', 'app1', 'ece362',
-		  'app2', extra_arguments)
+	send_file('1000479573', 'iso.txt', 'ece361', 'app1', 'ece362',
+			  'app2', extra_arguments)
 
-print(extra_arguments)
+	print(extra_arguments)
 
 
 ''' Important Information: An ACK or a NACK message is only a message with an ACK/NACK as its data. Therefore, it 
@@ -0,0 +1,154 @@
+#
+# Copyright 2020 University of Toronto
+#
+# Permission is hereby granted, to use this software and associated
+# documentation files (the "Software") in course work at the University
+# of Toronto, or for personal use. Other uses are prohibited, in
+# particular the distribution of the Software either publicly or to third
+# parties.
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+import lzma
+import struct
+import zlib
+
+''' Helpers shared by sender.py and receiver.py for the extended lab1 transfer modes.
+
+The file size message may carry options after the size, e.g. "5842;window=8". A plain size with no options is the
+original protocol, so old senders and receivers keep working with each other.'''
+
+''' Replies to a file size message or a stop-and-wait segment.'''
+ACK = b'ACK'
+NACK = b'NACK'
+
+
+class ByteSocket:
+	''' Wraps the lab1 Socket so that the transfer code deals in bytes only. The Socket sends and receives str
+	messages; every message is decoded to str as latin-1 on sendto and encoded back on recvfrom, which maps each byte
+	to one character and back, so binary segments and the text control messages go through unchanged and stay
+	readable by senders and receivers that use the Socket directly.'''
+	def __init__(self, s):
+		self.s = s
+
+	def change_source_address(self, address=None, port=None):
+		self.s.change_source_address(address=address, port=port)
+
+	def sendto(self, application_data, dst_address=None, dst_port=None):
+		self.s.sendto(application_data.decode('latin-1'), dst_address=dst_address, dst_port=dst_port)
+
+	def recvfrom(self):
+		a, b = self.s.recvfrom()
+		return a, b.encode('latin-1')
+
+
+''' Header in front of every sequence-numbered segment: the segment number as an unsigned 32-bit integer.'''
+SEGMENT_HEADER = struct.Struct('!I')
+
+
+def pack_file_info(file_size, **options):
+	fields = [str(file_size)]
+	for key in sorted(options):
+		if options[key] is not None:
+			fields.append('%s=%s' % (key, options[key]))
+	return ';'.join(fields).encode()
+
+
+def unpack_file_info(message):
+	fields = message.decode().split(';')
+	options = {}
+	for field in fields[1:]:
+		key, value = field.split('=', 1)
+		options[key] = value
+	return int(fields[0]), options
+
+
+def pack_segment(seqnum, data):
+	return SEGMENT_HEADER.pack(seqnum) + data
+
+
+def unpack_segment(message):
+	seqnum, = SEGMENT_HEADER.unpack_from(message)
+	return seqnum, message[SEGMENT_HEADER.size:]
+
+
+''' Windowed acknowledgements name the next segment the receiver expects: "ACK <n>" confirms every segment before n,
+"NACK <n>" asks the sender to go back and resend from segment n.'''
+def pack_ack(reply, seqnum):
+	return b'%s %d' % (reply, seqnum)
+
+
+def unpack_ack(message):
+	reply, seqnum = message.split()
+	return reply, int(seqnum)
+
+
+''' Splits a file into count contiguous byte ranges for a parallel transfer. Both sides compute the ranges from the
+file size and the number of streams, so the ranges themselves are never sent.'''
+def split_ranges(file_size, count):
+	ranges = []
+	offset = 0
+	for i in range(count):
+		length = file_size // count + (1 if i < file_size % count else 0)
+		ranges.append((offset, length))
+		offset += length
+	return ranges
+
+
+''' Streaming compressors that can be agreed on in the file size message with "compress=<name>".'''
+COMPRESSORS = {'zlib': zlib.compressobj, 'lzma': lzma.LZMACompressor}
+DECOMPRESSORS = {'zlib': zlib.decompressobj, 'lzma': lzma.LZMADecompressor}
+
+
+class CompressedSegments:
+	''' Compresses chunks of the file as they are read and yields the compressed stream in segments of buffer_size
+	bytes. bytes_in and bytes_out count the data before and after compression.'''
+	def __init__(self, chunks, method, buffer_size):
+		self.chunks = chunks
+		self.compressor = COMPRESSORS[method]()
+		self.buffer_size = buffer_size
+		self.bytes_in = 0
+		self.bytes_out = 0
+
+	def __iter__(self):
+		pending = bytearray()
+		for chunk in self.chunks:
+			self.bytes_in += len(chunk)
+			pending += self.compressor.compress(chunk)
+			while len(pending) >= self.buffer_size:
+				yield self._take(pending)
+		pending += self.compressor.flush()
+		while len(pending) > 0:
+			yield self._take(pending)
+
+	def _take(self, pending):
+		segment = bytes(pending[:self.buffer_size])
+		del pending[:self.buffer_size]
+		self.bytes_out += len(segment)
+		return segment
+
+
+''' In a session many files follow each other in one stream of segments. Each file starts with a header segment:
+the file size and the length of the name, the name, then as much file data as fits in the segment. A header with
+an empty name ends the session.'''
+FILE_HEADER = struct.Struct('!QH')
+
+
+def pack_file_header(file_size, name, data=b''):
+	name = name.encode()
+	return FILE_HEADER.pack(file_size, len(name)) + name + data
+
+
+def unpack_file_header(segment):
+	file_size, name_length = FILE_HEADER.unpack_from(segment)
+	name_end = FILE_HEADER.size + name_length
+	return file_size, segment[FILE_HEADER.size:name_end].decode(), segment[name_end:]
@@ -0,0 +1,115 @@
+#
+# Copyright 2020 University of Toronto
+#
+# Permission is hereby granted, to use this software and associated
+# documentation files (the "Software") in course work at the University
+# of Toronto, or for personal use. Other uses are prohibited, in
+# particular the distribution of the Software either publicly or to third
+# parties.
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+import struct
+import threading
+import time
+
+# a negative acknowledgement answers the out-of-order frame that revealed the gap, like its acknowledgement would,
+# and names rnext, the first frame the receiver is missing
+NAK = b'NAK'
+NAK_SEQNUM = struct.Struct('i')
+
+def pack_nak(rnext):
+    return NAK + NAK_SEQNUM.pack(rnext)
+
+def unpack_nak(data):
+    # sequence number named by a NAK, or None if data is not a NAK
+    if (data[:len(NAK)] != NAK or len(data) != len(NAK) + NAK_SEQNUM.size):
+        return None
+    return NAK_SEQNUM.unpack_from(data, len(NAK))[0]
+
+class AckPolicy:
+    ''' Decides when the receiver sends its cumulative acknowledgement: after every ack_every in-order frames, or
+    ack_delay seconds after the first frame that is not acknowledged yet, whichever comes first. Out-of-order frames
+    send the pending acknowledgement at once, otherwise a duplicate acknowledgement at most once every
+    dup_ack_interval seconds. With ack_every = 1 and dup_ack_interval = 0 every frame is acknowledged. '''
+    def __init__(self, ack_every=1, ack_delay=0.01, dup_ack_interval=0):
+        self.ack_every = ack_every
+        self.ack_delay = ack_delay
+        self.dup_ack_interval = dup_ack_interval
+
+        # the delay timer sends from its own thread
+        self.lock = threading.Lock()
+        self.ack_frame = None
+        self.pending = 0
+        self.timer = None
+        self.last_duplicate = None
+
+        # acknowledgement statistics
+        self.acks_sent = 0
+        self.duplicates_suppressed = 0
+
+    def accepted(self, ack_frame, frames=1):
+        # frames in-order frames were accepted, ack_frame acknowledges everything received so far
+        with self.lock:
+            self.ack_frame = ack_frame
+            self.pending += frames
+            if (self.pending >= self.ack_every):
+                self._send()
+            elif (self.timer is None):
+                self.timer = threading.Timer(self.ack_delay, self._expired)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def redirect(self, ack_frame):
+        # same acknowledgement, sent to where ack_frame goes from now on
+        with self.lock:
+            if (self.ack_frame is not None):
+                self.ack_frame = ack_frame
+
+    def duplicate(self):
+        # a frame arrived out of order, repeat the last acknowledgement so that the sender notices the gap
+        with self.lock:
+            if (self.ack_frame is None):
+                return
+            if (self.pending > 0):
+                self._send()
+                return
+            now = time.monotonic()
+            if (self.last_duplicate is not None and now - self.last_duplicate < self.dup_ack_interval):
+                self.duplicates_suppressed += 1
+                return
+            self.last_duplicate = now
+            self._send()
+
+    def flush(self):
+        # send the pending acknowledgement, if any, right away
+        with self.lock:
+            if (self.pending > 0):
+                self._send()
+
+    def _expired(self):
+        with self.lock:
+            if (self.timer is not threading.current_thread()):
+                # cancelled, and a newer timer may already be running
+                return
+            self.timer = None
+            if (self.pending > 0):
+                self._send()
+
+    def _send(self):
+        if (self.timer is not None):
+            self.timer.cancel()
+            self.timer = None
+        self.pending = 0
+        self.ack_frame.send()
+        self.acks_sent += 1
@@ -0,0 +1,86 @@
+#
+# Copyright 2020 University of Toronto
+#
+# Permission is hereby granted, to use this software and associated
+# documentation files (the "Software") in course work at the University
+# of Toronto, or for personal use. Other uses are prohibited, in
+# particular the distribution of the Software either publicly or to third
+# parties.
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+import argparse
+import json
+import sys
+
+from duplexendpoint import DuplexEndpoint, DUPLEX_HEADER
+from pmtu import probe_datagram_size, MAX_DATAGRAM
+
+parser = argparse.ArgumentParser()
+parser.add_argument('send_file', help='file sent to the other end')
+parser.add_argument('receive_file', help='where the file from the other end is written')
+parser.add_argument('--config-file', default='./config.json')
+parser.add_argument('--listen', help='wait on receiver_address:receiver_port for the other end',
+                    action="store_true")
+
+args = parser.parse_args()
+
+# read config parameters
+with open(args.config_file, 'r') as config_file:
+    config = json.load(config_file)
+
+# the listening end takes the receiver's address, the other end the sender's and sends to the listening end first
+if (args.listen):
+    bind_addr = (config['receiver_address'], config['receiver_port'])
+    peer = None
+else:
+    bind_addr = (config['sender_address'], 0)
+    peer = (config['receiver_address'], config['receiver_port'])
+
+# "frame_size": "auto" probes the path to the other end for the largest datagram that is not fragmented and leaves
+# room in it for the header; the two ends may pick different sizes, so any datagram has to fit in the receive buffer
+frame_size_discovered = (config['frame_size'] == 'auto')
+if frame_size_discovered:
+    datagram_size = probe_datagram_size(config['sender_address'] if args.listen else config['receiver_address'])
+    if (datagram_size is None):
+        print('Path MTU discovery is not supported here, set frame_size in %s.' %args.config_file, file=sys.stderr)
+        sys.exit(1)
+    config['frame_size'] = datagram_size - DUPLEX_HEADER.size
+
+endpoint = DuplexEndpoint(args.send_file,
+                          args.receive_file,
+                          bind_addr,
+                          peer,
+                          config['frame_size'],
+                          config['timeout'],
+                          config['maxseqnum'],
+                          config['sender_window_size'],
+                          ack_delay = config.get('ack_delay', 0.01),
+                          ack_every = config.get('ack_every', 2),
+                          bufsize = MAX_DATAGRAM if frame_size_discovered else None)
+try:
+    endpoint.run()
+finally:
+    endpoint.close()
+
+if frame_size_discovered:
+    print("Frame size: %d (path MTU discovery)" %config['frame_size'])
+else:
+    print("Frame size:", config['frame_size'])
+print("Window size:", config['sender_window_size'])
+print("Frames delivered:", endpoint.frames_delivered)
+print("Frames received:", endpoint.frames_received)
+print("Data frames sent:", endpoint.data_frames_sent)
+print("Standalone ACKs sent:", endpoint.ack_frames_sent)
+print("Piggybacked ACKs:", endpoint.acks_piggybacked)
+print("Total transmission time: %.6f s" %(endpoint.t_finish - endpoint.t_start))
@@ -0,0 +1,193 @@
+#
+# Copyright 2020 University of Toronto
+#
+# Permission is hereby granted, to use this software and associated
+# documentation files (the "Software") in course work at the University
+# of Toronto, or for personal use. Other uses are prohibited, in
+# particular the distribution of the Software either publicly or to third
+# parties.
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+import selectors
+import socket
+import struct
+import time
+
+# every datagram carries a sequence number and a cumulative acknowledgement (rnext) in front of the data; NONE in
+# the sequence number marks a standalone acknowledgement, NONE in the acknowledgement a frame that carries none
+DUPLEX_HEADER = struct.Struct('ii')
+NONE = -1
+
+class DuplexEndpoint:
+    ''' One end of a full-duplex transfer: it sends one file and receives another over the same UDP socket. Both
+    directions run Go-Back-N with cumulative acknowledgements, and the acknowledgement for the data received rides
+    on the next data frame sent. Only if no data frame goes out within ack_delay seconds, ack_every frames wait for
+    it, or a gap is detected, is a standalone acknowledgement sent. An empty data frame ends each direction; once
+    both ended the endpoint lingers for linger seconds to acknowledge retransmissions of the peer's last frames.
+
+    With peer = None the endpoint waits for the peer to send first and answers to its address. Datagrams of up to
+    bufsize bytes are received, by default the size of a full frame. '''
+    def __init__(self, send_file, receive_file, bind_addr, peer, frame_size, timeout, maxseqnum, window_size,
+                 ack_delay=0.01, ack_every=2, linger=None, bufsize=None):
+        self.fp = open(send_file, 'rb')
+        self.out = open(receive_file, 'wb')
+        self.peer = peer
+        self.frame_size = frame_size
+        self.timeout = timeout
+        self.maxseqnum = maxseqnum
+        self.window_size = window_size
+        self.ack_delay = ack_delay
+        self.ack_every = ack_every
+        self.linger = linger if linger is not None else 3 * timeout
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(bind_addr)
+        self.sock.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.sock, selectors.EVENT_READ)
+        self.bufsize = bufsize if bufsize is not None else frame_size + DUPLEX_HEADER.size
+
+        # sending side: frames in flight as (seqnum, data), the next sequence number and the retransmission timer
+        self.send_queue = []
+        self.seqnum = 0
+        self.end_sent = False
+        self.retransmit_at = None
+
+        # receiving side: the next expected sequence number and when a pending acknowledgement must go out
+        self.rnext = 0
+        self.ack_at = None
+        self.ack_pending = 0
+        self.end_received = False
+
+        # transmission statistics
+        self.data_frames_sent = 0
+        self.ack_frames_sent = 0
+        self.acks_piggybacked = 0
+        self.frames_delivered = 0
+        self.frames_received = 0
+
+    def _next(self, seqnum):
+        return seqnum + 1 if seqnum < self.maxseqnum else 0
+
+    def _send(self, seqnum, data):
+        # send a data frame (or a standalone acknowledgement with seqnum NONE), carrying rnext whenever the peer sent
+        # anything, which also settles a pending acknowledgement
+        ack = self.rnext if (self.frames_received > 0 or self.end_received) else NONE
+        self.sock.sendto(DUPLEX_HEADER.pack(seqnum, ack) + data, self.peer)
+        if (seqnum == NONE):
+            self.ack_frames_sent += 1
+        else:
+            self.data_frames_sent += 1
+            if (self.ack_at is not None):
+                self.acks_piggybacked += 1
+        self.ack_at = None
+        self.ack_pending = 0
+
+    def _fill_window(self):
+        while (not self.end_sent and len(self.send_queue) < self.window_size):
+            data = self.fp.read(self.frame_size)
+            self.send_queue.append((self.seqnum, data))
+            self._send(self.seqnum, data)
+            self.seqnum = self._next(self.seqnum)
+            if (data == b''):
+                # the empty frame ends this direction
+                self.end_sent = True
+            if (self.retransmit_at is None):
+                self.retransmit_at = time.monotonic() + self.timeout
+
+    def _handle_ack(self, ack):
+        # ack names the next frame the peer expects, every frame in flight before it was received
+        if (self.send_queue == []):
+            return
+        count = (ack - self.send_queue[0][0]) % (self.maxseqnum + 1)
+        if (count == 0 or count > len(self.send_queue)):
+            return
+        del self.send_queue[:count]
+        self.frames_delivered += count
+        self.retransmit_at = time.monotonic() + self.timeout if self.send_queue != [] else None
+
+    def _handle_data(self, seqnum, data):
+        if (seqnum == self.rnext and not self.end_received):
+            # frame with correct sequence number, accept it and acknowledge it later, on a data frame if possible
+            self.rnext = self._next(self.rnext)
+            self.frames_received += 1
+            if (len(data) == 0):
+                self.end_received = True
+            else:
+                self.out.write(data)
+            self.ack_pending += 1
+            if (self.ack_pending >= self.ack_every):
+                # do not hold back the peer's window any longer
+                self.ack_at = time.monotonic()
+            elif (self.ack_at is None):
+                self.ack_at = time.monotonic() + self.ack_delay
+        else:
+            # out of order or a retransmission of a received frame: acknowledge rnext at once
+            self.ack_at = time.monotonic()
+
+    def _receive(self):
+        # drain every datagram that is ready
+        while True:
+            try:
+                message, address = self.sock.recvfrom(self.bufsize)
+            except BlockingIOError:
+                return
+            if (self.peer is None):
+                self.peer = address
+            seqnum, ack = DUPLEX_HEADER.unpack_from(message)
+            if (ack != NONE):
+                self._handle_ack(ack)
+            if (seqnum != NONE):
+                self._handle_data(seqnum, message[DUPLEX_HEADER.size:])
+            self.last_receive = time.monotonic()
+
+    def run(self):
+        self.t_start = time.monotonic()
+        self.last_receive = self.t_start
+        while True:
+            if (self.peer is not None):
+                self._fill_window()
+
+            done = (self.end_sent and self.send_queue == [] and self.end_received)
+            now = time.monotonic()
+            if (done and self.ack_at is None and now - self.last_receive >= self.linger):
+                break
+
+            # sleep until the next datagram or the next timer
+            deadlines = [deadline for deadline in (self.retransmit_at, self.ack_at) if deadline is not None]
+            if done:
+                deadlines.append(self.last_receive + self.linger)
+            wait = max(min(deadlines) - now, 0) if deadlines != [] else None
+            if self.selector.select(wait) != []:
+                self._receive()
+                # acknowledgements may have opened the window, new data frames carry the pending acknowledgement
+                if (self.peer is not None):
+                    self._fill_window()
+
+            now = time.monotonic()
+            if (self.ack_at is not None and now >= self.ack_at and self.peer is not None):
+                # no data frame to carry the acknowledgement, send it on its own
+                self._send(NONE, b'')
+            if (self.retransmit_at is not None and now >= self.retransmit_at):
+                # go back n: send every frame in flight again
+                for seqnum, data in self.send_queue:
+                    self._send(seqnum, data)
+                self.retransmit_at = now + self.timeout
+        self.t_finish = time.monotonic()
+
+    def close(self):
+        self.selector.close()
+        self.sock.close()
+        self.out.close()
+        self.fp.close()
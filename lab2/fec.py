@@ -0,0 +1,121 @@
+#
+# Copyright 2020 University of Toronto
+#
+# Permission is hereby granted, to use this software and associated
+# documentation files (the "Software") in course work at the University
+# of Toronto, or for personal use. Other uses are prohibited, in
+# particular the distribution of the Software either publicly or to third
+# parties.
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+import struct
+
+# parity frames go out with sequence number FEC_SEQNUM, which no data frame uses. Their data is the header
+# (absolute index of the block's first frame, number of frames in the block, xor of their lengths) followed by
+# the xor of the block's payloads, each padded with zeros to the longest one
+FEC_SEQNUM = -1
+FEC_HEADER = struct.Struct('QHI')
+
+class FecEncoder:
+    ''' Builds one XOR parity frame for every k data frames, and one for the frames left at the end of the file. '''
+    def __init__(self, k):
+        self.k = k
+        self.index = 0
+        self.parity_frames = 0
+        self._reset()
+
+    def _reset(self):
+        self.start = self.index
+        self.count = 0
+        self.parity = 0
+        self.lengths = 0
+        self.size = 0
+
+    def add(self, data):
+        # account for the next data frame, returns the data of a parity frame once the block is complete
+        self.parity ^= int.from_bytes(data, 'little')
+        self.lengths ^= len(data)
+        self.size = max(self.size, len(data))
+        self.count += 1
+        self.index += 1
+        if (self.count == self.k):
+            return self.flush()
+        return None
+
+    def flush(self):
+        # parity frame data for the frames of an incomplete block, None if there are none
+        if (self.count == 0):
+            return None
+        data = FEC_HEADER.pack(self.start, self.count, self.lengths) + self.parity.to_bytes(self.size, 'little')
+        self.parity_frames += 1
+        self._reset()
+        return data
+
+
+class FecDecoder:
+    ''' Keeps the payloads of the current block, by absolute frame index, and the parity frames received for it.
+    A frame that is missing from a block whose other frames and parity frame arrived is rebuilt from them. '''
+    def __init__(self, k):
+        self.k = k
+        # absolute index -> (payload, address of the frame it came with)
+        self.frames = {}
+        # absolute index of a block's first frame -> (count, lengths, parity, address)
+        self.parity = {}
+        self.recovered = 0
+
+    def store(self, index, payload, address):
+        self.frames.setdefault(index, (bytes(payload), address))
+
+    def add_parity(self, data, address):
+        start, count, lengths = FEC_HEADER.unpack_from(data)
+        parity = int.from_bytes(data[FEC_HEADER.size:], 'little')
+        self.parity.setdefault(start, (count, lengths, parity, address))
+
+    def take(self, index):
+        # (payload, address) of frame index if it arrived or can be rebuilt, otherwise None
+        entry = self.frames.get(index)
+        if (entry is None):
+            entry = self._recover(index)
+        return entry
+
+    def _recover(self, index):
+        start = index - index % self.k
+        if (start not in self.parity):
+            return None
+        count, lengths, parity, address = self.parity[start]
+        if (index >= start + count):
+            return None
+        for i in range(start, start + count):
+            if (i == index):
+                continue
+            if (i not in self.frames):
+                # more than one frame of the block is missing
+                return None
+            payload = self.frames[i][0]
+            parity ^= int.from_bytes(payload, 'little')
+            lengths ^= len(payload)
+        entry = (parity.to_bytes(lengths, 'little'), address)
+        self.frames[index] = entry
+        self.recovered += 1
+        return entry
+
+    def advance(self, index):
+        # every frame before index was accepted, forget the blocks before the one of index
+        start = index - index % self.k
+        if (index != start):
+            return
+        for i in [i for i in self.frames if i < start]:
+            del self.frames[i]
+        for i in [i for i in self.parity if i < start]:
+            del self.parity[i]
@@ -0,0 +1,103 @@
+#
+# Copyright 2020 University of Toronto
+#
+# Permission is hereby granted, to use this software and associated
+# documentation files (the "Software") in course work at the University
+# of Toronto, or for personal use. Other uses are prohibited, in
+# particular the distribution of the Software either publicly or to third
+# parties.
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+from senderbase import SenderBase
+from ece361.lab2.frame import Frame
+
+class NChannelStopWaitSender(SenderBase):
+    ''' N stop-and-wait channels interleaved over one link, like HARQ. Frame i of the file goes out on channel
+    i % channels, and every channel runs plain stop and wait with a 1-bit sequence number: the frame's sequence
+    number is 2 * channel + bit and the receiver acknowledges it with the other bit. A channel only starts its
+    next frame while that frame is less than channels frames ahead of the oldest undelivered one, so the receiver
+    never has to hold more than channels frames to put them back in order. '''
+    def __init__(self, file, destination, frame_size, timeout, maxseqnum, channels, transport=None,
+                 use_mmap=False):
+        super().__init__(file, destination, frame_size, timeout, maxseqnum, transport, use_mmap)
+        # every channel needs its own two sequence numbers
+        if 2 * channels > maxseqnum + 1:
+            raise ValueError('n-channel stop and wait needs 2 * channels <= maxseqnum + 1')
+        self.channels = channels
+        self.channel_bits = [0] * channels
+
+    def _expected_ack(self, seqnum, nextseqnum):
+        # the receiver acknowledges with the channel's next bit
+        return seqnum ^ 1
+
+    def _arqsend(self):
+        # implementation of N-channel Stop and Wait ARQ
+        in_flight = [None] * self.channels
+        end_of_file = False
+        next_index = 0
+        base = 0
+        delivered = set()
+        resend_queue = []
+        while True:
+            # start the next frames on their channels, at most one frame per channel is in flight
+            while not end_of_file and next_index < base + self.channels:
+                channel = next_index % self.channels
+                self.seqnum = 2 * channel + self.channel_bits[channel]
+                current_frame = self.get_next_frame()
+                if (current_frame.data == b''):
+                    end_of_file = True
+                    break
+                in_flight[channel] = (next_index, current_frame)
+                resend_queue.append(current_frame)
+                next_index += 1
+
+            outstanding = [entry[1] for entry in in_flight if entry is not None]
+            if (outstanding == []):
+                # end of file and every frame acknowledged
+                break
+
+            # send the new frames and the frames that timed out
+            for frame in resend_queue:
+                frame.send()
+                self.frames_sent += 1
+                self.stats.frame_sent(frame)
+                if SenderBase.ENABLE_DEBUG:
+                    print('DEBUG -', frame.seqnum, frame.data, 'SENT')
+
+            self.wait_for_multiple_ack_nacks(outstanding)
+
+            resend_queue = []
+            for channel in range(self.channels):
+                if (in_flight[channel] is None):
+                    continue
+                index, frame = in_flight[channel]
+                if (frame.status() == Frame.Status.ack_nacked):
+                    # the channel is free again and flips its bit
+                    in_flight[channel] = None
+                    self.channel_bits[channel] ^= 1
+                    delivered.add(index)
+                    self.frames_delivered += 1
+                    self.stats.frame_delivered(frame)
+                    if SenderBase.ENABLE_DEBUG:
+                        print('DEBUG -', frame.seqnum, frame.data, 'DELIVERED')
+                    self.release_frame(frame)
+                elif (frame.status() == Frame.Status.timedout):
+                    resend_queue.append(frame)
+                    self.stats.frame_timedout(frame)
+                    if SenderBase.ENABLE_DEBUG:
+                        print('DEBUG -', frame.seqnum, frame.data, 'TIMEDOUT')
+
+            while base in delivered:
+                delivered.discard(base)
+                base += 1
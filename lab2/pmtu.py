@@ -0,0 +1,78 @@
+#
+# Copyright 2020 University of Toronto
+#
+# Permission is hereby granted, to use this software and associated
+# documentation files (the "Software") in course work at the University
+# of Toronto, or for personal use. Other uses are prohibited, in
+# particular the distribution of the Software either publicly or to third
+# parties.
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+import errno
+import socket
+import sys
+import time
+
+# Linux socket options, not exported by every Python build
+IP_MTU_DISCOVER = getattr(socket, 'IP_MTU_DISCOVER', 10)
+IP_PMTUDISC_DO = getattr(socket, 'IP_PMTUDISC_DO', 2)
+IP_MTU = getattr(socket, 'IP_MTU', 14)
+
+# IPv4 and UDP headers, and the largest payload of a UDP datagram
+UDP_IP_HEADERS = 28
+MAX_DATAGRAM = 65507
+
+# probes go to the discard port of the receiving host so that the receiver never sees them
+DISCARD_PORT = 9
+
+def probe_datagram_size(address, port=DISCARD_PORT, probe_wait=0.01):
+    ''' Binary search for the largest UDP payload that reaches address without IP fragmentation. The probes are
+    sent with the don't-fragment bit set (IP_PMTUDISC_DO): a probe larger than the path MTU the kernel knows fails
+    with EMSGSIZE, and a router that drops one lowers the path MTU (IP_MTU) through an ICMP message that arrives
+    within probe_wait seconds. Returns None where path MTU discovery is not supported (Linux only). '''
+    if not sys.platform.startswith('linux'):
+        return None
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_DO)
+        sock.connect((address, port))
+        low = 0
+        high = min(MAX_DATAGRAM, sock.getsockopt(socket.IPPROTO_IP, IP_MTU) - UDP_IP_HEADERS)
+        while low < high:
+            size = (low + high + 1) // 2
+            if _probe(sock, size, probe_wait):
+                low = size
+            else:
+                high = size - 1
+        # an ICMP message that arrived after the last probe may still have lowered the path MTU
+        return min(low, sock.getsockopt(socket.IPPROTO_IP, IP_MTU) - UDP_IP_HEADERS)
+    except OSError:
+        return None
+    finally:
+        sock.close()
+
+def _probe(sock, size, probe_wait):
+    for attempt in range(2):
+        try:
+            sock.send(bytes(size))
+            break
+        except ConnectionRefusedError:
+            # port unreachable for an earlier probe, reported on this send; send again
+            continue
+        except OSError as error:
+            if error.errno == errno.EMSGSIZE:
+                return False
+            raise
+    time.sleep(probe_wait)
+    return size <= sock.getsockopt(socket.IPPROTO_IP, IP_MTU) - UDP_IP_HEADERS
@@ -20,11 +20,19 @@
 #
 
 import argparse
+import itertools
+import os
+import select
 import struct
-from itertools import cycle
 import json
+import socket
+import time
 from ece361.lab2.socket import Socket
 from ece361.lab2.frame import Frame
+from ackpolicy import AckPolicy
+from receiversession import ReceiverSession
+from fec import FEC_HEADER
+from pmtu import MAX_DATAGRAM
 
 parser = argparse.ArgumentParser()
 parser.add_argument("file")
@@ -37,37 +45,131 @@ args = parser.parse_args()
 with open(args.config_file, 'r') as config_file:
     config = json.load(config_file)
 
-maxseqnum = config['maxseqnum']
-seqnum_pool = cycle(range(0, maxseqnum + 1))
+# received size is size of frame + size of sequence number in bytes; with "frame_size": "auto" the sender picks
+# the frame size, so any datagram has to fit
+if (config['frame_size'] == 'auto'):
+    bufsize = MAX_DATAGRAM
+else:
+    bufsize = config['frame_size'] + struct.calcsize('i')
+FRAME_HEADER = struct.Struct('i')
 
-# received size is size of frame + size of sequence number in bytes
-bufsize = config['frame_size'] + struct.calcsize('i')
+# "fec_k": k lets the sliding window sender follow every k frames with an xor parity frame, which carries a header
+# in front of a frame-sized payload
+fec_k = config.get('fec_k', 0) if config['arq_protocol'] == 'slidingwindow' else 0
+if (fec_k and config['frame_size'] != 'auto'):
+    bufsize += FEC_HEADER.size
+
+# "receiver_batch": n drains up to n ready datagrams per wake-up, writes the payloads accepted from them at once
+# and acknowledges them together
+batch_size = config.get('receiver_batch', 1)
+
+# "multi_session": true receives from many senders at once, each into its own file next to args.file. Sessions
+# are told apart by "session_key": "host" (the default, one upload per host) or "address" (host and port, which
+# needs senders that use one socket, i.e. "sender_transport": "shared"; Frame sockets change port every frame).
+# A session that received nothing for "session_timeout" seconds is closed. Every session gets a file of its own,
+# numbered in the order the sessions were opened, so a later upload from the same sender does not overwrite it
+multi_session = config.get('multi_session', False)
+session_key = config.get('session_key', 'host')
+session_timeout = config.get('session_timeout', 30)
+session_numbers = itertools.count(1)
+
+def new_session(file):
+    return ReceiverSession(file,
+                           config['maxseqnum'],
+                           selective_repeat = (config['arq_protocol'] == 'selectiverepeat'),
+                           receiver_window_size = config.get('receiver_window_size',
+                                                             config.get('sender_window_size', 1)),
+                           # go-back-n acknowledgements can be delayed and rate limited, by default every frame
+                           # is acknowledged
+                           ack_policy = AckPolicy(ack_every = config.get('ack_every', 1),
+                                                  ack_delay = config.get('ack_delay', 0.01),
+                                                  dup_ack_interval = config.get('dup_ack_interval', 0)),
+                           # "nak": true sends a negative acknowledgement for rnext when a gap is detected
+                           send_naks = config.get('nak', False),
+                           # "arq_protocol": "nchannel" runs "channels" stop-and-wait channels side by side
+                           channels = config.get('channels', 1) if config['arq_protocol'] == 'nchannel' else 0,
+                           fec_k = fec_k,
+                           debug = args.debug)
+
+def session_file(key):
+    # <host>-<n>-<file> or <host>-<port>-<n>-<file> in the directory of args.file, n is the session number
+    directory, base = os.path.split(args.file)
+    if (session_key == 'address'):
+        return os.path.join(directory, '%s-%d-%d-%s' %(key[0], key[1], next(session_numbers), base))
+    return os.path.join(directory, '%s-%d-%s' %(key, next(session_numbers), base))
 
 # open a new socket to listen on a fixed port
-serverSock = Socket(destination = None,
-                    recvfrom_bytes = bufsize,
-                    bind_addr = (config['receiver_address'], config['receiver_port']))
+if (batch_size > 1 or multi_session):
+    # the ece361 Socket receives one datagram per call, the batched loop needs a plain socket it can drain and the
+    # multi-session loop one it can wait on with a timeout
+    serverSock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    serverSock.bind((config['receiver_address'], config['receiver_port']))
+    buffers = [bytearray(bufsize) for _ in range(batch_size)]
+else:
+    serverSock = Socket(destination = None,
+                        recvfrom_bytes = bufsize,
+                        bind_addr = (config['receiver_address'], config['receiver_port']))
 
-with open(args.file, 'wb') as f:
-    rnext = next(seqnum_pool)
-    ack_frame = None
-    while True:
-        # wait for message from the sender
+def receive_batch():
+    # wait for messages from the sender, return them as a list of (seqnum, data, address); in batched mode data
+    # is a view of a preallocated buffer that is only valid until the next call
+    if (isinstance(serverSock, Socket)):
         serverSock.recvfrom()
         frame = Frame.unpack_data(serverSock.msg_received['message'])
-        if (args.debug):
-            print('DEBUG -', frame.seqnum, frame.data, 'RECEIVED')
-        if (frame.seqnum == rnext):
-            # frame with correct sequence number, accept it
-            rnext = next(seqnum_pool)
-            f.write(frame.data)
-            # update an aknowledgement frame with rnext and no data
-            ack_frame = Frame(seqnum = rnext,
-                              data = b'',
-                              destination = serverSock.msg_received['address'])
-            if (args.debug):
-                print('DEBUG -', frame.seqnum, frame.data, 'ACCEPTED')
+        return [(frame.seqnum, frame.data, serverSock.msg_received['address'])]
 
-        # send the acknowledgement for rnext
-        if (ack_frame):
-            ack_frame.send()
+    batch = []
+    flags = 0
+    for buffer in buffers:
+        try:
+            nbytes, address = serverSock.recvfrom_into(buffer, 0, flags)
+        except BlockingIOError:
+            break
+        batch.append((FRAME_HEADER.unpack_from(buffer)[0], memoryview(buffer)[FRAME_HEADER.size:nbytes], address))
+        # block for the first datagram only, then take whatever else is ready
+        flags = socket.MSG_DONTWAIT
+    return batch
+
+if not multi_session:
+    session = new_session(args.file)
+    try:
+        while True:
+            session.receive(receive_batch())
+    finally:
+        session.close()
+
+# session table: session key -> ReceiverSession
+sessions = {}
+try:
+    while True:
+        # wait no longer than until the longest idle session times out, so idle sessions are evicted even when
+        # nothing arrives
+        timeout = None
+        if (sessions):
+            timeout = max(0, min(session.last_active for session in sessions.values()) + session_timeout
+                          - time.monotonic())
+        ready, _, _ = select.select([serverSock], [], [], timeout)
+        batch = receive_batch() if ready else []
+
+        # hand every session its frames of the batch, in the order they arrived
+        frames_by_session = {}
+        for frame in batch:
+            address = frame[2]
+            key = tuple(address) if session_key == 'address' else address[0]
+            frames_by_session.setdefault(key, []).append(frame)
+        for key, frames in frames_by_session.items():
+            if key not in sessions:
+                sessions[key] = new_session(session_file(key))
+                if (args.debug):
+                    print('DEBUG -', key, 'SESSION OPENED')
+            sessions[key].receive(frames)
+
+        # evict idle sessions
+        now = time.monotonic()
+        for key in [key for key, session in sessions.items() if now - session.last_active > session_timeout]:
+            sessions.pop(key).close()
+            if (args.debug):
+                print('DEBUG -', key, 'SESSION CLOSED')
+finally:
+    for session in sessions.values():
+        session.close()
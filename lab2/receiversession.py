@@ -0,0 +1,191 @@
+#
+# Copyright 2020 University of Toronto
+#
+# Permission is hereby granted, to use this software and associated
+# documentation files (the "Software") in course work at the University
+# of Toronto, or for personal use. Other uses are prohibited, in
+# particular the distribution of the Software either publicly or to third
+# parties.
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+from collections import deque
+from itertools import cycle
+import time
+from ece361.lab2.frame import Frame
+from ackpolicy import AckPolicy, pack_nak
+from fec import FEC_SEQNUM, FecDecoder
+
+class ReceiverSession:
+    ''' Receiving side of one transfer: the sequence state, the acknowledgement state and the output file of one
+    sender. receive() takes the frames of one wake-up as (seqnum, data, address) tuples, writes the payloads they
+    complete at once and acknowledges them. '''
+    def __init__(self, file, maxseqnum, selective_repeat=False, receiver_window_size=1, ack_policy=None,
+                 send_naks=False, channels=0, fec_k=0, debug=False):
+        self.file = file
+        self.f = open(file, 'wb')
+        self.maxseqnum = maxseqnum
+        self.seqnum_pool = cycle(range(0, maxseqnum + 1))
+        self.rnext = next(self.seqnum_pool)
+        self.frames_accepted = 0
+
+        # selective repeat buffers out-of-order frames that fall inside the receive window
+        self.selective_repeat = selective_repeat
+        self.receiver_window_size = receiver_window_size
+        self.buffered_frames = {}
+
+        # n-channel stop and wait: the expected bit of every channel, the frames each channel accepted and the
+        # channel whose frame is written next
+        self.channels = channels
+        self.channel_bits = [0] * channels
+        self.channel_frames = [deque() for _ in range(channels)]
+        self.next_channel = 0
+
+        # go-back-n acknowledgements go through the ack policy, naks are sent once per missing frame
+        self.ack_policy = ack_policy if ack_policy is not None else AckPolicy()
+        self.send_naks = send_naks
+        self.nak_sent_for = None
+
+        # go-back-n with fec_k keeps the frames of the current block, received in order or ahead of rnext within
+        # the window, to rebuild a lost frame from the block's parity frame
+        self.fec = FecDecoder(fec_k) if fec_k else None
+        self.recovered_reported = 0
+
+        self.debug = debug
+        self.last_active = time.monotonic()
+
+    def receive(self, frames):
+        self.last_active = time.monotonic()
+        payloads = []
+        ack_frame = None
+        accepted = 0
+        out_of_order = False
+        for seqnum, data, address in frames:
+            if (self.debug):
+                print('DEBUG -', seqnum, bytes(data), 'RECEIVED')
+            if self.channels:
+                channel, bit = divmod(seqnum, 2)
+                if (channel >= self.channels):
+                    continue
+                if (bit == self.channel_bits[channel]):
+                    # the channel's next frame, accept it and flip the channel's bit
+                    self.channel_frames[channel].append(bytes(data))
+                    self.channel_bits[channel] ^= 1
+                    # frames were handed to the channels in turn, so take them back in the same order
+                    while self.channel_frames[self.next_channel]:
+                        payloads.append(self.channel_frames[self.next_channel].popleft())
+                        self.next_channel = (self.next_channel + 1) % self.channels
+                # acknowledge with the bit the channel expects next, for a duplicate as well
+                Frame(seqnum = 2 * channel + self.channel_bits[channel],
+                      data = b'',
+                      destination = address).send()
+                if (self.debug):
+                    print('DEBUG -', seqnum, bytes(data), 'ACKED')
+                continue
+
+            if self.selective_repeat:
+                distance = (seqnum - self.rnext) % (self.maxseqnum + 1)
+                if (distance < self.receiver_window_size):
+                    # inside the window: keep the frame until every earlier frame has arrived
+                    self.buffered_frames.setdefault(seqnum, bytes(data))
+                    while self.rnext in self.buffered_frames:
+                        payloads.append(self.buffered_frames.pop(self.rnext))
+                        self.rnext = next(self.seqnum_pool)
+                elif (distance < self.maxseqnum + 1 - self.receiver_window_size):
+                    # neither in the window nor in the previous window, cannot be acknowledged
+                    continue
+                # acknowledge the frame itself; frames from the previous window are acknowledged again since
+                # their first acknowledgement must have been lost
+                Frame(seqnum = seqnum,
+                      data = b'',
+                      destination = address).send()
+                if (self.debug):
+                    print('DEBUG -', seqnum, bytes(data), 'ACKED')
+                continue
+
+            if (self.fec is not None and seqnum == FEC_SEQNUM):
+                self.fec.add_parity(data, address)
+            elif (seqnum == self.rnext):
+                if (self.fec is not None):
+                    self.fec.store(self.frames_accepted, data, address)
+                ack_frame = self._accept(seqnum, data, address, payloads)
+                accepted += 1
+            else:
+                out_of_order = True
+                if (self.fec is not None):
+                    # a frame is ahead of rnext only within half of the sequence numbers, beyond that it may be an
+                    # old duplicate from a go-back-n retransmission
+                    distance = (seqnum - self.rnext) % (self.maxseqnum + 1)
+                    if (distance < min(self.receiver_window_size, (self.maxseqnum + 1) // 2)):
+                        self.fec.store(self.frames_accepted + distance, data, address)
+                    elif ((seqnum + 1) % (self.maxseqnum + 1) == self.rnext):
+                        # a rebuilt frame was acknowledged to where its parity frame came from, answer its
+                        # retransmission where the sender waits for it
+                        self.ack_policy.redirect(Frame(seqnum = self.rnext,
+                                                       data = b'',
+                                                       destination = address))
+                if (self.send_naks and self.nak_sent_for != self.rnext):
+                    # ask for rnext right away instead of waiting for the sender to time out
+                    self.nak_sent_for = self.rnext
+                    Frame(seqnum = (seqnum + 1) % (self.maxseqnum + 1),
+                          data = pack_nak(self.rnext),
+                          destination = address).send()
+                    if (self.debug):
+                        print('DEBUG -', self.rnext, 'NAKED')
+
+            if (self.fec is not None):
+                # accept the frames that arrived ahead of rnext or can be rebuilt from a parity frame
+                entry = self.fec.take(self.frames_accepted)
+                while (entry is not None):
+                    ack_frame = self._accept(self.rnext, entry[0], entry[1], payloads)
+                    accepted += 1
+                    entry = self.fec.take(self.frames_accepted)
+
+        if (self.fec is not None and self.fec.recovered > self.recovered_reported):
+            # report rebuilt frames as they happen, the receiver is usually stopped rather than closed
+            self.recovered_reported = self.fec.recovered
+            print('%s: frames recovered by FEC: %d' %(self.file, self.fec.recovered))
+
+        # write the accepted payloads at once
+        if (len(payloads) == 1):
+            self.f.write(payloads[0])
+        elif (payloads != []):
+            self.f.write(b''.join(payloads))
+
+        # one cumulative acknowledgement for the frames; out-of-order frames send it at once, or the
+        # acknowledgement for rnext again
+        if (accepted > 0):
+            self.ack_policy.accepted(ack_frame, accepted)
+        if out_of_order:
+            if (accepted > 0):
+                self.ack_policy.flush()
+            else:
+                self.ack_policy.duplicate()
+
+    def _accept(self, seqnum, data, address, payloads):
+        # frame with correct sequence number, accept it
+        self.rnext = next(self.seqnum_pool)
+        self.frames_accepted += 1
+        if (self.fec is not None):
+            self.fec.advance(self.frames_accepted)
+        payloads.append(data)
+        if (self.debug):
+            print('DEBUG -', seqnum, bytes(data), 'ACCEPTED')
+        # return an aknowledgement frame with rnext and no data
+        return Frame(seqnum = self.rnext,
+                     data = b'',
+                     destination = address)
+
+    def close(self):
+        self.ack_policy.flush()
+        self.f.close()
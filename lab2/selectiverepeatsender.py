@@ -0,0 +1,89 @@
+#
+# Copyright 2020 University of Toronto
+#
+# Permission is hereby granted, to use this software and associated
+# documentation files (the "Software") in course work at the University
+# of Toronto, or for personal use. Other uses are prohibited, in
+# particular the distribution of the Software either publicly or to third
+# parties.
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+from senderbase import SenderBase
+from ece361.lab2.frame import Frame
+
+class SelectiveRepeatSender(SenderBase):
+    def __init__(self, file, destination, frame_size, timeout, maxseqnum, sender_window_size, transport=None,
+                 use_mmap=False):
+        super().__init__(file, destination, frame_size, timeout, maxseqnum, transport, use_mmap)
+        # a frame's sequence number must not come round again while the receiver may still buffer an older frame
+        # with the same number, so the window can cover at most half of the sequence numbers
+        if sender_window_size > (maxseqnum + 1) // 2:
+            raise ValueError('selective repeat needs sender_window_size <= (maxseqnum + 1) / 2')
+        self.send_queue = []
+        self.sender_window_size = sender_window_size
+
+    def _expected_ack(self, seqnum, nextseqnum):
+        # the selective repeat receiver acknowledges every frame individually with the frame's own sequence number
+        return seqnum
+
+    def _arqsend(self):
+        # implementation of the Selective Repeat ARQ protocol
+        end_of_file = False
+        acked = set()
+        resend_queue = []
+        while True:
+            # fill up the sending window, new frames are sent for the first time below
+            while not end_of_file and len(self.send_queue) < self.sender_window_size:
+                current_frame = self.get_next_frame()
+                if (current_frame.data == b''):
+                    end_of_file = True
+                    break
+                self.send_queue.append(current_frame)
+                resend_queue.append(current_frame)
+
+            if (self.send_queue == []):
+                # end of file and every frame acknowledged
+                break
+
+            # send the new frames and the frames that timed out, frames still in flight are left alone
+            for frame in resend_queue:
+                frame.send()
+                self.frames_sent += 1
+                self.stats.frame_sent(frame)
+                if SenderBase.ENABLE_DEBUG:
+                    print('DEBUG -', frame.seqnum, frame.data, 'SENT')
+
+            # wait on the frames that are not acknowledged yet
+            outstanding = [frame for frame in self.send_queue if frame.seqnum not in acked]
+            self.wait_for_multiple_ack_nacks(outstanding)
+
+            resend_queue = []
+            for frame in outstanding:
+                if (frame.status() == Frame.Status.ack_nacked):
+                    acked.add(frame.seqnum)
+                    self.stats.frame_delivered(frame)
+                    if SenderBase.ENABLE_DEBUG:
+                        print('DEBUG -', frame.seqnum, frame.data, 'ACKED')
+                elif (frame.status() == Frame.Status.timedout):
+                    resend_queue.append(frame)
+                    self.stats.frame_timedout(frame)
+                    if SenderBase.ENABLE_DEBUG:
+                        print('DEBUG -', frame.seqnum, frame.data, 'TIMEDOUT')
+
+            # slide the window past the acknowledged frames at its start
+            while (self.send_queue != [] and self.send_queue[0].seqnum in acked):
+                frame = self.send_queue.pop(0)
+                acked.discard(frame.seqnum)
+                self.frames_delivered += 1
+                self.release_frame(frame)
@@ -20,17 +20,24 @@
 #
 
 import argparse
+import struct
 import sys
 import json
 
 from senderbase import SenderBase
 from stopwaitsender import StopWaitSender
 from slidingwindowsender import SlidingWindowSender
+from selectiverepeatsender import SelectiveRepeatSender
+from nchannelsender import NChannelStopWaitSender
+from transport import SharedSocketTransport
+from fec import FEC_HEADER
+from pmtu import probe_datagram_size
 
 parser = argparse.ArgumentParser()
 parser.add_argument('file')
 parser.add_argument('--config-file', default='./config.json')
 parser.add_argument('--debug', help='print debug messages', action="store_true")
+parser.add_argument('--stats-json', help='write the transmission statistics to this file as JSON')
 
 args = parser.parse_args()
 
@@ -43,20 +50,67 @@ else:
 with open(args.config_file, 'r') as config_file:
     config = json.load(config_file)
 
+# "frame_size": "auto" probes the path to the receiver for the largest datagram that is not fragmented, and leaves
+# room in it for the sequence number (and the fec header of parity frames)
+frame_size_discovered = (config['frame_size'] == 'auto')
+if frame_size_discovered:
+    datagram_size = probe_datagram_size(config['receiver_address'])
+    if (datagram_size is None):
+        print('Path MTU discovery is not supported here, set frame_size in %s.' %args.config_file, file=sys.stderr)
+        sys.exit(1)
+    header_size = struct.calcsize('i')
+    if (config['arq_protocol'] == 'slidingwindow' and config.get('fec_k', 0)):
+        header_size += FEC_HEADER.size
+    config['frame_size'] = datagram_size - header_size
+
+# "sender_transport": "shared" sends all frames through one socket instead of one socket per frame
+if (config.get('sender_transport', 'frame') == 'shared'):
+    transport = SharedSocketTransport((config['receiver_address'], config['receiver_port']))
+else:
+    transport = None
+
+# "auto_window": true lets the sliding window sender adjust its window, starting from sender_window_size, to the
+# measured bandwidth-delay product
+# "mmap": true maps the file and sends slices of the mapping as frame payloads instead of reading every frame
 # send the file using the ARQ protocol specified in the config file
 if (config['arq_protocol'] == 'stopandwait'):
     sender = StopWaitSender(args.file,
                            (config['receiver_address'], config['receiver_port']),
                             config['frame_size'],
                             config['timeout'],
-                            config['maxseqnum'])
+                            config['maxseqnum'],
+                            transport,
+                            use_mmap = config.get('mmap', False))
 elif (config['arq_protocol'] == 'slidingwindow'):
        sender = SlidingWindowSender(args.file,
                                    (config['receiver_address'], config['receiver_port']),
                                     config['frame_size'],
                                     config['timeout'],
                                     config['maxseqnum'],
-                                    config['sender_window_size'])
+                                    config['sender_window_size'],
+                                    transport,
+                                    fast_retransmit = config.get('nak', False),
+                                    use_mmap = config.get('mmap', False),
+                                    auto_window = config.get('auto_window', False),
+                                    fec_k = config.get('fec_k', 0))
+elif (config['arq_protocol'] == 'selectiverepeat'):
+    sender = SelectiveRepeatSender(args.file,
+                                   (config['receiver_address'], config['receiver_port']),
+                                   config['frame_size'],
+                                   config['timeout'],
+                                   config['maxseqnum'],
+                                   config['sender_window_size'],
+                                   transport,
+                                   use_mmap = config.get('mmap', False))
+elif (config['arq_protocol'] == 'nchannel'):
+    sender = NChannelStopWaitSender(args.file,
+                                    (config['receiver_address'], config['receiver_port']),
+                                    config['frame_size'],
+                                    config['timeout'],
+                                    config['maxseqnum'],
+                                    config.get('channels', 1),
+                                    transport,
+                                    use_mmap = config.get('mmap', False))
 else:
     print('Unkown ARQ protocol %s.' %config['arq_protocol'], file=sys.stderr)
     sys.exit(0)
@@ -64,7 +118,10 @@ else:
 sender.sendfile()
 
 print("ARQ protocol:", config['arq_protocol'])
-print("Frame size:", config['frame_size'])
+if frame_size_discovered:
+    print("Frame size: %d (path MTU discovery)" %config['frame_size'])
+else:
+    print("Frame size:", config['frame_size'])
 print("Frames sent:", sender.frames_sent)
 print("Frames delivered:", sender.frames_delivered)
 print("Total transmission time:", sender.t_finish - sender.t_start)
@@ -72,5 +129,39 @@ print("Total transmission time:", sender.t_finish - sender.t_start)
 if (config['arq_protocol'] == 'stopandwait'):
     print("Average RTT:", sender.rtt_total/sender.frames_delivered)
     print("Maximum RTT:", sender.rtt_max)
+elif (config['arq_protocol'] == 'nchannel'):
+    print("Channels:", sender.channels)
+elif (config['arq_protocol'] == 'slidingwindow' and sender.auto_window):
+    print("Sender window size: auto, final %d, largest %d" %(sender.sender_window_size, sender.largest_window_size))
 else:
     print("Sender window size:", config['sender_window_size'])
+
+if (config['arq_protocol'] == 'slidingwindow' and config.get('nak', False)):
+    print("Fast retransmits:", sender.fast_retransmits)
+
+if (config['arq_protocol'] == 'slidingwindow' and sender.fec is not None):
+    # overhead is the share of parity frames among all frames sent
+    frames_total = sender.frames_sent + sender.fec.parity_frames
+    print("FEC parity frames: %d (overhead %.1f%%)" %(sender.fec.parity_frames,
+                                                      100 * sender.fec.parity_frames / frames_total
+                                                      if frames_total > 0 else 0))
+
+rtt = sender.stats.rtt.as_dict()
+if (rtt['samples'] > 0):
+    print("RTT p50/p90/p99: %.6f/%.6f/%.6f" %(rtt['p50'], rtt['p90'], rtt['p99']))
+print("Retransmissions:", sender.stats.retransmissions)
+print("Timeouts:", sender.stats.timeouts)
+
+if (args.stats_json):
+    stats = {'arq_protocol': config['arq_protocol'],
+             'frame_size': config['frame_size'],
+             'sender_window_size': getattr(sender, 'sender_window_size', None),
+             'timeout': config['timeout'],
+             'frames_sent': sender.frames_sent,
+             'frames_delivered': sender.frames_delivered,
+             'transmission_time': (sender.t_finish - sender.t_start).total_seconds()}
+    if (config['arq_protocol'] == 'slidingwindow' and sender.fec is not None):
+        stats['fec_parity_frames'] = sender.fec.parity_frames
+    stats.update(sender.stats.as_dict())
+    with open(args.stats_json, 'w') as stats_file:
+        json.dump(stats, stats_file, indent=4)
@@ -20,40 +20,97 @@
 #
 
 from abc import ABC, abstractmethod
-from itertools import cycle
 import datetime
+import mmap
+import os
 from ece361.lab2.frame import Frame
+from stats import SenderStats
 
 class SenderBase(ABC):
     ENABLE_DEBUG = False
 
-    def __init__(self, file, destination, frame_size, timeout, maxseqnum):
+    def __init__(self, file, destination, frame_size, timeout, maxseqnum, transport=None, use_mmap=False):
         self.fp = open(file, 'rb')
         self.destination = destination
         self.frame_size = frame_size
         self.timeout = timeout
 
+        # with use_mmap the file is mapped and every payload is a memoryview slice of the mapping, which saves the
+        # read call and the copy per frame (an empty file cannot be mapped and is read as usual)
+        self.map = None
+        self.view = None
+        self.offset = 0
+        if use_mmap and os.fstat(self.fp.fileno()).st_size > 0:
+            self.map = mmap.mmap(self.fp.fileno(), 0, access=mmap.ACCESS_READ)
+            self.view = memoryview(self.map)
+
+        # frames are sent through their own Frame sockets unless a transport (e.g. SharedSocketTransport) is given
+        self.transport = transport
+
         # transmission statistics
         self.frames_sent = 0
         self.frames_delivered = 0
+        self.stats = SenderStats()
 
         # sequence numbers are between 0 and maxseqnum inclusive
-        self.seqnumpool = cycle(range(maxseqnum + 1))
-        self.seqnum = next(self.seqnumpool)
+        self.maxseqnum = maxseqnum
+        self.seqnum = 0
 
-    def get_next_frame(self):
-        # read data from file
-        data = self.fp.read(self.frame_size)
+    def _read_data(self, frame=None):
+        # read data from file, into the frame's own buffer if a pooled frame is given
+        if self.view is not None:
+            data = self.view[self.offset:self.offset + self.frame_size]
+            self.offset += len(data)
+            if self.transport is None:
+                # Frame packs its payload with struct, which needs bytes
+                data = data.tobytes()
+            return data
+        if frame is not None:
+            buffer = frame.payload_buffer(self.frame_size)
+            nbytes = self.fp.readinto(buffer)
+            return buffer if nbytes == len(buffer) else buffer[:nbytes]
+        return self.fp.read(self.frame_size)
 
+    def get_next_frame(self):
         # create a new frame object and advance sequence number
         # note: the order of the next 3 lines is important
-        nextseqnum = next(self.seqnumpool)
-        new_frame = Frame(self.seqnum, data, self.destination, expected_ack=nextseqnum, timeout=self.timeout)
+        nextseqnum = self.seqnum + 1 if self.seqnum < self.maxseqnum else 0
+        expected_ack = self._expected_ack(self.seqnum, nextseqnum)
+        if self.transport is not None:
+            # transport frames are pooled and the data is read into the frame's own buffer
+            new_frame = self.transport.frame(self.seqnum, expected_ack=expected_ack, timeout=self.timeout)
+            new_frame.set_data(self._read_data(new_frame))
+        else:
+            new_frame = Frame(self.seqnum, self._read_data(), self.destination, expected_ack=expected_ack,
+                              timeout=self.timeout)
         self.seqnum = nextseqnum
 
         # return the encapsulated Frame object
         return new_frame
 
+    def send_unacknowledged(self, seqnum, data):
+        # a frame the receiver does not acknowledge, e.g. an fec parity frame
+        if self.transport is not None:
+            self.transport.send_unacknowledged(seqnum, data)
+        else:
+            Frame(seqnum, data, self.destination).send()
+
+    def release_frame(self, frame):
+        # the frame left the window and may be reused
+        if self.transport is not None:
+            self.transport.release(frame)
+
+    def wait_for_multiple_ack_nacks(self, frames):
+        # wait on all frames in parallel through the transport they were sent with
+        if self.transport is not None:
+            self.transport.wait_for_multiple_ack_nacks(frames)
+        else:
+            Frame.wait_for_multiple_ack_nacks(frames)
+
+    def _expected_ack(self, seqnum, nextseqnum):
+        # the receiver acknowledges a frame by naming the next sequence number it expects
+        return nextseqnum
+
     def sendfile(self):
         self.t_start = datetime.datetime.now()
         self._arqsend()
@@ -65,4 +122,13 @@ class SenderBase(ABC):
 
 
     def __del__(self):
+        if self.map is not None:
+            self.view.release()
+            try:
+                self.map.close()
+            except BufferError:
+                # frames still hold slices, the mapping goes away with them
+                pass
         self.fp.close()
+        if self.transport is not None:
+            self.transport.close()
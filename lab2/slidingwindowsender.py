@@ -19,86 +19,187 @@
 # SOFTWARE.
 #
 
-import select
+from collections import deque
+import heapq
+import math
+import time
 from senderbase import SenderBase
+from ackpolicy import unpack_nak
+from fec import FEC_SEQNUM, FecEncoder
 from ece361.lab2.frame import Frame
 
 class SlidingWindowSender(SenderBase):
-	def __init__(self, file, destination, frame_size, timeout, maxseqnum, sender_window_size):
-		super().__init__(file, destination, frame_size, timeout, maxseqnum)
+	# the window is WINDOW_GAIN times the estimated bandwidth-delay product, which leaves room for the delivery
+	# rate to grow; the bandwidth is the largest of the last RATE_SAMPLES delivery rates. MIN_WINDOW_SIZE keeps a few
+	# frames in flight so that a loss is still noticed before the timeout
+	WINDOW_GAIN = 2
+	RATE_SAMPLES = 10
+	MIN_WINDOW_SIZE = 4
+
+	def __init__(self, file, destination, frame_size, timeout, maxseqnum, sender_window_size, transport=None,
+				 fast_retransmit=False, use_mmap=False, auto_window=False, fec_k=0):
+		super().__init__(file, destination, frame_size, timeout, maxseqnum, transport, use_mmap)
+		# with fec_k the receiver keeps frames that arrive ahead of rnext; an old duplicate must not be taken for
+		# one of them, so the window can cover at most half of the sequence numbers
+		if fec_k and sender_window_size > (maxseqnum + 1) // 2:
+			raise ValueError('fec_k needs sender_window_size <= (maxseqnum + 1) / 2')
 		self.send_queue = []
 		self.sender_window_size = sender_window_size
 		self.frames_sent = 0
 		self.frames_delivered = 0
-		timed_out =0
+
+		# with auto_window the window starts at sender_window_size and follows the measured bandwidth-delay
+		# product; go-back-n allows at most maxseqnum frames in flight, half of the sequence numbers with fec_k
+		self.auto_window = auto_window
+		self.max_window_size = (maxseqnum + 1) // 2 if fec_k else maxseqnum
+		self.largest_window_size = sender_window_size
+		self.rate_samples = deque(maxlen=self.RATE_SAMPLES)
+		self.rate_start = None
+
+		# with fec_k every fec_k new frames are followed by an xor parity frame, from which the receiver rebuilds
+		# one lost frame of the block without a retransmission
+		self.fec = FecEncoder(fec_k) if fec_k else None
+
+		# with fast_retransmit a NAK from the receiver resends the window at once instead of after the timeout
+		self.fast_retransmit = fast_retransmit
+		self.fast_retransmitted = None
+		self.fast_retransmits = 0
+
+		# retransmission timers: a heap of (expiry, counter, frame) and the current expiry of every frame in flight
+		self.timers = []
+		self.timer_expiry = {}
+		self.timer_count = 0
+
+	def _send_frame(self, frame):
+		# send (or resend) a frame and arm its retransmission timer
+		frame.send()
+		self.frames_sent += 1
+		self.stats.frame_sent(frame)
+		if SenderBase.ENABLE_DEBUG:
+			print('DEBUG -', frame.seqnum, frame.data, 'SENT')
+		expiry = time.monotonic() + self.timeout
+		self.timer_expiry[id(frame)] = expiry
+		self.timer_count += 1
+		heapq.heappush(self.timers, (expiry, self.timer_count, frame))
+
+	def _resend_expired_frames(self):
+		# only the frames whose own timer expired are sent again; timers of acknowledged frames and timers that
+		# were re-armed by a later send are stale and skipped
+		now = time.monotonic()
+		while (self.timers != [] and self.timers[0][0] <= now):
+			expiry, _, frame = heapq.heappop(self.timers)
+			if (self.timer_expiry.get(id(frame)) != expiry):
+				continue
+			if SenderBase.ENABLE_DEBUG:
+				print('DEBUG -', frame.seqnum, frame.data, 'TIMEDOUT')
+			self.stats.frame_timedout(frame)
+			self._send_frame(frame)
+
+	def _send_parity(self, data):
+		if (data is not None):
+			self.send_unacknowledged(FEC_SEQNUM, data)
+			if SenderBase.ENABLE_DEBUG:
+				print('DEBUG -', FEC_SEQNUM, 'PARITY SENT')
+
+	def _tune_window(self):
+		# delivery rate over intervals of at least one round trip, times the smallest rtt seen, is the
+		# bandwidth-delay product in frames
+		min_rtt = self.stats.rtt.min
+		if (min_rtt is None):
+			return
+		now = time.monotonic()
+		if (self.rate_start is None):
+			self.rate_start = (now, self.frames_delivered)
+			return
+		start, delivered = self.rate_start
+		if (now - start < min_rtt):
+			return
+		self.rate_samples.append((self.frames_delivered - delivered) / (now - start))
+		self.rate_start = (now, self.frames_delivered)
+
+		bdp = max(self.rate_samples) * min_rtt
+		self.sender_window_size = min(max(int(math.ceil(self.WINDOW_GAIN * bdp)), self.MIN_WINDOW_SIZE),
+									  self.max_window_size)
+		self.largest_window_size = max(self.largest_window_size, self.sender_window_size)
+
+	def _nak_for(self, frame):
+		# sequence number of the missing frame if the receiver answered frame with a NAK
+		if (frame.status() != Frame.Status.ack_nacked):
+			return None
+		return unpack_nak(frame.retrieve_ack_nack().data)
+
 	def _arqsend(self):
 		# implementation of the Sliding Window ARQ protocol
-		timed_out = 0
+		# every frame is sent once and resent only when its own timer expires; the timers are kept in a heap
+		# ordered by expiry time
+		end_of_file = False
 		while True:
 			# a queue is the perfect data structure for implementing sliding window
-			while (len(self.send_queue) < self.sender_window_size):
-				# fill up the sending window
+			while (not end_of_file and len(self.send_queue) < self.sender_window_size):
+				# fill up the sending window, each new frame is sent right away
 				current_frame = self.get_next_frame()
-				# add frame to queue
+				if (current_frame.data == b''):
+					end_of_file = True
+					if (self.fec is not None):
+						self._send_parity(self.fec.flush())
+					break
 				self.send_queue.append(current_frame)
+				self._send_frame(current_frame)
+				if (self.fec is not None):
+					self._send_parity(self.fec.add(current_frame.data))
 
-			if (self.send_queue[0].data == b''):
-				# end of file
+			if (self.send_queue == []):
+				# end of file and every frame acknowledged
 				break
 
-		#	''' Part 2: Implement the sliding window ARQ protocol:'''
-#
-	#		''' Step 1: Go through the send queue and send those frames that need to be sent/resent'''
-		#	''' Do not forget to update the frames_sent variable'''
-			#''' Your Code'''
-			for frame in (self.send_queue):
-				frame.send()
-				#print (frame.data)
-				self.frames_sent += 1
-				#print("frame_sent",self.frames_sent)
-				#print(frame.data,	  'DELIVERED.:', frame.seqnum)
-#		''' Step 2: wait on all frames in the send_queue in parallel'''
-#		''' Hint: call the wait_for_multiple_ack_nacks function'''
-#		''' Your Code'''
-	
-		#while (self.frames_delivered < self.frames_sent):
-			ack_i=0
-			Frame.wait_for_multiple_ack_nacks(self.send_queue)
-#		''' Step 3: Go through the send queue and process ack/nack/timeout'''
-#		''' Use the status() method to check status of the frame'''
-#		''' Hint: In the sliding window ARQ if a frame is acked it is implied that all earlier frames are also acked even without receiving an explicit ack(why?)'''
-#		''' Your Code'''
-
-			#while (self.send_queue != []):
-			for i in range( len(self.send_queue)- 1, -1, -1):
-				#print ("index: ",i, "status: ", self.send_queue[i].status())
-				if (self.send_queue[i].status() == Frame.Status.ack_nacked):
-					#print (self.send_queue[i].status())
-				
-				# frame received by the other side
-					#ack_frame = self.send_queue[i].retrieve_ack_nack()
-					ack_i = i +1
-					
-					#print("ack_i: ", ack_i)
-					break
-				elif (self.send_queue[i].status() == Frame.Status.timedout):
-					timed_out +=1
-					#ack_i = i + 1
-					#break
+			# wait on all frames in the send_queue in parallel
+			self.wait_for_multiple_ack_nacks(self.send_queue)
 
+			# an ack for a frame implies that all earlier frames were received as well, so find the last acked
+			# frame in the window
+			ack_i = 0
+			for i in range(len(self.send_queue) - 1, -1, -1):
+				if (self.send_queue[i].status() == Frame.Status.ack_nacked and self._nak_for(self.send_queue[i]) is None):
+					ack_i = i + 1
+					break
 
+			# the newest nak names the first missing frame, every frame before that one was received
+			nak_frame = None
+			if self.fast_retransmit:
+				for i in range(len(self.send_queue) - 1, ack_i - 1, -1):
+					missing = self._nak_for(self.send_queue[i])
+					if (missing is None):
+						continue
+					for k in range(ack_i, i):
+						if (self.send_queue[k].seqnum == missing):
+							ack_i = k
+							nak_frame = self.send_queue[k]
+							break
+					break
 
-			''' Step 4: Remove acked frames by calling the 'pop' method on the send queue'''
-			''' In the sliding window ARQ there might be more than 1 acked frames in an iteration'''
-			''' so you might need to call 'pop' multiple times'''
-			''' Do not forget to update the frames_delivered variable'''
-			''' Your Code'''
-			for  a in range(0, ack_i):
+			# remove acked frames and their timers
+			for a in range(0, ack_i):
+				frame = self.send_queue.pop(0)
+				del self.timer_expiry[id(frame)]
 				self.frames_delivered += 1
-				self.send_queue.pop(0)
-			
-		#	print(self.seqnum,self.frames_delivered,self.frames_sent)
-
+				# only a frame's own ack gives an rtt sample, frames before it are acknowledged implicitly
+				acked = (frame.status() == Frame.Status.ack_nacked and self._nak_for(frame) is None)
+				self.stats.frame_delivered(frame, acked)
+				if (frame is self.fast_retransmitted):
+					self.fast_retransmitted = None
+				self.release_frame(frame)
 
+			if (self.auto_window and ack_i > 0 and not end_of_file):
+				# once the whole file is in flight the window no longer matters
+				self._tune_window()
 
+			if (nak_frame is not None and nak_frame is not self.fast_retransmitted):
+				# go back to the missing frame once; should the retransmission be lost too, its timer recovers it
+				self.fast_retransmitted = nak_frame
+				self.fast_retransmits += 1
+				if SenderBase.ENABLE_DEBUG:
+					print('DEBUG -', nak_frame.seqnum, 'NACKED')
+				for frame in self.send_queue:
+					self._send_frame(frame)
 
+			self._resend_expired_frames()
@@ -0,0 +1,106 @@
+#
+# Copyright 2020 University of Toronto
+#
+# Permission is hereby granted, to use this software and associated
+# documentation files (the "Software") in course work at the University
+# of Toronto, or for personal use. Other uses are prohibited, in
+# particular the distribution of the Software either publicly or to third
+# parties.
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+import math
+
+class RttHistogram:
+    ''' Streaming histogram of RTT samples. Samples are counted in logarithmic buckets that are 2^(1/16) apart
+    (about 4% wide), so recording is O(1), memory stays small however many frames are sent, and percentiles are
+    accurate to a bucket. '''
+    BUCKETS_PER_OCTAVE = 16
+    MIN_RTT = 1e-6
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, rtt):
+        # rtt in seconds
+        bucket = int(math.floor(math.log2(max(rtt, self.MIN_RTT) / self.MIN_RTT) * self.BUCKETS_PER_OCTAVE))
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += rtt
+        if (self.min is None or rtt < self.min):
+            self.min = rtt
+        if (self.max is None or rtt > self.max):
+            self.max = rtt
+
+    def percentile(self, p):
+        # midpoint of the bucket holding the p-th percentile, clamped to the samples seen
+        if (self.count == 0):
+            return None
+        rank = p / 100 * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if (seen >= rank):
+                rtt = self.MIN_RTT * 2 ** ((bucket + 0.5) / self.BUCKETS_PER_OCTAVE)
+                return min(max(rtt, self.min), self.max)
+        return self.max
+
+    def as_dict(self):
+        return {'samples': self.count,
+                'mean': self.total / self.count if self.count else None,
+                'min': self.min,
+                'max': self.max,
+                'p50': self.percentile(50),
+                'p90': self.percentile(90),
+                'p99': self.percentile(99)}
+
+
+class SenderStats:
+    ''' Transmission statistics fed by the senders: an RTT histogram, the number of retransmissions per delivered
+    frame and the number of timeouts. Following Karn's algorithm only frames that were sent once and acknowledged
+    themselves give an RTT sample, since the acknowledgement of a retransmitted frame may belong to any of its
+    transmissions. '''
+    def __init__(self):
+        self.rtt = RttHistogram()
+        self.timeouts = 0
+        self.retransmissions = 0
+        # number of retransmissions -> number of frames delivered after that many
+        self.retransmissions_per_frame = {}
+        # id(frame) -> transmissions of every frame in flight
+        self.transmissions = {}
+
+    def frame_sent(self, frame):
+        count = self.transmissions.get(id(frame), 0)
+        if (count > 0):
+            self.retransmissions += 1
+        self.transmissions[id(frame)] = count + 1
+
+    def frame_timedout(self, frame):
+        self.timeouts += 1
+
+    def frame_delivered(self, frame, acked=True):
+        # acked is False for frames delivered implicitly by a cumulative acknowledgement of a later frame
+        count = self.transmissions.pop(id(frame), 1)
+        self.retransmissions_per_frame[count - 1] = self.retransmissions_per_frame.get(count - 1, 0) + 1
+        if (acked and count == 1):
+            self.rtt.add((frame.acktime() - frame.sendtime()).total_seconds())
+
+    def as_dict(self):
+        return {'rtt': self.rtt.as_dict(),
+                'timeouts': self.timeouts,
+                'retransmissions': self.retransmissions,
+                'retransmissions_per_frame': {str(k): v for k, v in sorted(self.retransmissions_per_frame.items())}}
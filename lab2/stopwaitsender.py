@@ -25,8 +25,8 @@ from senderbase import SenderBase
 from ece361.lab2.frame import Frame
 
 class StopWaitSender(SenderBase):
-    def __init__(self, file, destination, frame_size, timeout, maxseqnum):
-        super().__init__(file, destination, frame_size, timeout, maxseqnum)
+    def __init__(self, file, destination, frame_size, timeout, maxseqnum, transport=None, use_mmap=False):
+        super().__init__(file, destination, frame_size, timeout, maxseqnum, transport, use_mmap)
         self.send_queue = []
 
         self.rtt_total = datetime.timedelta()
@@ -70,6 +70,7 @@ class StopWaitSender(SenderBase):
                 print('DEBUG -', current_frame.seqnum, current_frame.data, 'SENT')
 
             self.frames_sent += 1
+            self.stats.frame_sent(current_frame)
 
             # wait for acknowledgement
             current_frame.wait_for_ack_nack()
@@ -80,12 +81,14 @@ class StopWaitSender(SenderBase):
                 self._update_rtt(current_frame.sendtime(), current_frame.acktime())
 
                 self.frames_delivered += 1
+                self.stats.frame_delivered(current_frame)
                 if SenderBase.ENABLE_DEBUG:
                     print ('DEBUG -', current_frame.seqnum, current_frame.data, 'DELIVERED',
                            'ACK:', current_frame.retrieve_ack_nack().seqnum)
-                self.send_queue.pop(0)
+                self.release_frame(self.send_queue.pop(0))
 
             elif (current_frame.status() == Frame.Status.timedout):
+                self.stats.frame_timedout(current_frame)
                 if SenderBase.ENABLE_DEBUG:
                     print('DEBUG -', current_frame.seqnum, current_frame.data, 'TIMEDOUT')
             else:
@@ -0,0 +1,177 @@
+#
+# Copyright 2020 University of Toronto
+#
+# Permission is hereby granted, to use this software and associated
+# documentation files (the "Software") in course work at the University
+# of Toronto, or for personal use. Other uses are prohibited, in
+# particular the distribution of the Software either publicly or to third
+# parties.
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+import datetime
+import selectors
+import socket
+import struct
+import time
+from ece361.lab2.frame import Frame
+
+# frames go out as the sequence number followed by the data, the layout receiver.py expects
+# (bufsize = frame_size + struct.calcsize('i'))
+FRAME_HEADER = struct.Struct('i')
+ACK_BUFSIZE = 65536
+
+
+class SharedSocketFrame:
+    ''' A frame sent through a SharedSocketTransport. It offers the part of the Frame interface the senders use:
+    status() is Frame.Status.ack_nacked once the expected acknowledgement arrived, Frame.Status.timedout once the
+    timeout passed without it, and None while the frame is unsent or in flight. Frames are pooled by the transport:
+    once released a frame is reset and handed out again, together with its header and payload buffers. '''
+    def __init__(self, transport):
+        self.transport = transport
+        self.header = bytearray(FRAME_HEADER.size)
+        # payload buffer the sender may read into, allocated on first use
+        self.buffer = None
+        self.buffer_view = None
+        self.data = b''
+        self.iov = [self.header, self.data]
+
+    def reset(self, seqnum, expected_ack, timeout):
+        self.seqnum = seqnum
+        self.expected_ack = expected_ack
+        self.timeout = timeout
+        FRAME_HEADER.pack_into(self.header, 0, seqnum)
+        self.deadline = None
+        self.ack = None
+        self._sendtime = None
+        self._acktime = None
+
+    def payload_buffer(self, size):
+        # the frame's own buffer of size bytes, reused while the frame is pooled
+        if (self.buffer is None or len(self.buffer) != size):
+            self.buffer = bytearray(size)
+            self.buffer_view = memoryview(self.buffer)
+        return self.buffer_view
+
+    def set_data(self, data):
+        # packed once, retransmissions reuse the header and the payload (which may be a memoryview)
+        self.data = data
+        self.iov[1] = data
+
+    def send(self):
+        self.ack = None
+        self._acktime = None
+        self.transport.send(self)
+
+    def status(self):
+        if self.ack is not None:
+            return Frame.Status.ack_nacked
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return Frame.Status.timedout
+        return None
+
+    def wait_for_ack_nack(self):
+        self.transport.wait_for_multiple_ack_nacks([self])
+
+    def sendtime(self):
+        return self._sendtime
+
+    def acktime(self):
+        return self._acktime
+
+    def retrieve_ack_nack(self):
+        return self.ack
+
+
+class SharedSocketTransport:
+    ''' Sends every frame of a sender through one UDP socket instead of one socket per Frame. The receiver answers
+    to the address a frame came from, so all acknowledgements arrive on this socket as well; they are matched to the
+    outstanding frames by the acknowledgement number, and waiting is a single selectors (epoll) wait on one
+    descriptor, however many frames are in flight. Released frames are kept and reused, so the pool grows to the
+    largest number of frames a sender had in flight. '''
+    def __init__(self, destination):
+        self.destination = destination
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.sock, selectors.EVENT_READ)
+
+        # acknowledgement number -> frame waiting for it
+        self.outstanding = {}
+        self.free_frames = []
+
+    def frame(self, seqnum, expected_ack, timeout):
+        # a frame without data, taken from the pool if one was released
+        if (self.free_frames != []):
+            frame = self.free_frames.pop()
+        else:
+            frame = SharedSocketFrame(self)
+        frame.reset(seqnum, expected_ack, timeout)
+        return frame
+
+    def release(self, frame):
+        # the sender is done with frame; a late acknowledgement must not reach the frame once it is reused
+        if (self.outstanding.get(frame.expected_ack) is frame):
+            del self.outstanding[frame.expected_ack]
+        self.free_frames.append(frame)
+
+    def send(self, frame):
+        try:
+            # gather header and payload in the kernel instead of concatenating them
+            self.sock.sendmsg(frame.iov, (), 0, self.destination)
+        except BlockingIOError:
+            # socket buffer full, the frame is treated as lost and times out
+            pass
+        frame._sendtime = datetime.datetime.now()
+        frame.deadline = time.monotonic() + frame.timeout
+        self.outstanding[frame.expected_ack] = frame
+
+    def send_unacknowledged(self, seqnum, data):
+        # a frame the receiver does not acknowledge, e.g. an fec parity frame
+        try:
+            self.sock.sendmsg([FRAME_HEADER.pack(seqnum), data], (), 0, self.destination)
+        except BlockingIOError:
+            pass
+
+    def _receive_acks(self):
+        # drain every acknowledgement that is ready, return how many of them completed a frame
+        completed = 0
+        while True:
+            try:
+                message = self.sock.recv(ACK_BUFSIZE)
+            except BlockingIOError:
+                return completed
+            ack = Frame.unpack_data(message)
+            frame = self.outstanding.pop(ack.seqnum, None)
+            if frame is not None:
+                frame.ack = ack
+                frame._acktime = datetime.datetime.now()
+                completed += 1
+
+    def wait_for_multiple_ack_nacks(self, frames):
+        ''' Same contract as Frame.wait_for_multiple_ack_nacks: returns once any outstanding frame is acknowledged
+        or the earliest of frames times out. '''
+        deadlines = [frame.deadline for frame in frames if frame.ack is None and frame.deadline is not None]
+        if deadlines == []:
+            return
+        deadline = min(deadlines)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if self.selector.select(remaining) != [] and self._receive_acks() > 0:
+                return
+
+    def close(self):
+        self.selector.close()
+        self.sock.close()